@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+import aiohttp
+import asyncio
+import itertools
+import time
+
+from http_client import HttpClient
+from http_client import compress_body
+from utils import Logger
+
+
+class AsyncHttpClient(HttpClient):
+    """
+    An asyncio handler of http client, to keep many requests in flight.
+    Configure is the same as HttpClient, including load_conf_file and
+    load_conf_data. Post data is compressed as "compression" is set, GET
+    responses are not cached.
+    Requests of launch_request_async and iter_requests return their results
+    instead of keeping them in response and respData, which belong to the
+    blocking launch_request of HttpClient.
+
+    Usage:
+        async with AsyncHttpClient(host = host, port = port, path = path,
+                concurrency = 1000) as client:
+            async for result in client.iter_requests(datas):
+                ...
+    """
+    def __init__(self, doPost=True, headers={}, url=None,
+            host=None, port=None, path=None, data=None,
+            name="asyncHttpClient", concurrency=100, timeout=None,
+            compression=None):
+        """
+        Initialization.
+        "concurrency" limits requests in flight and pooled connections.
+        "timeout" is total seconds of a request, None for no limit.
+        "compression" of post data is "gzip", "zstd" or None.
+        """
+        super().__init__(doPost, headers, url, host, port, path, data, name,
+                compression = compression)
+        self.__concurrency = concurrency
+        self.__timeout = timeout
+        self.__aioSession = None
+
+    @property
+    def concurrency(self):
+        """
+        Return concurrency.
+        """
+        return self.__concurrency
+
+    @concurrency.setter
+    def concurrency(self, value):
+        """
+        Set concurrency, which applies to sessions opened later.
+        """
+        if not isinstance(value, int) or value < 1:
+            Logger.error("Set concurrency of http client failed.")
+            return False
+
+        self.__concurrency = value
+        return True
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def open(self):
+        """
+        Open the aiohttp session, which pools connections of this client.
+        """
+        if self.__aioSession is None or self.__aioSession.closed:
+            self.__aioSession = aiohttp.ClientSession(
+                    connector = aiohttp.TCPConnector(limit = self.concurrency),
+                    timeout = aiohttp.ClientTimeout(total = self.__timeout))
+        return self.__aioSession
+
+    async def close(self):
+        """
+        Close the aiohttp session.
+        """
+        if self.__aioSession is not None:
+            await self.__aioSession.close()
+            self.__aioSession = None
+
+    async def launch_request_async(self, data=None, waitTime=0):
+        """
+        note   : Launch one request without blocking the event loop.
+        param  :
+            data        : Body of post request, self.data if None.
+            waitTime    : Seconds to wait after response, without blocking
+                          other requests.
+        return : Dict of "status", "headers", "body", "elapsed" and "error".
+        """
+        session = await self.open()
+        url = self.requestUrl
+        if data is None:
+            data = self.data
+        headers = self.headers
+        if self.doPost and self.compression is not None and \
+                data is not None and not isinstance(data, (dict, list, tuple)):
+            data = compress_body(data, self.compression)
+            if not isinstance(data, bytes):
+                data = b"".join(data)
+            headers = dict(headers or {})
+            headers["Content-Encoding"] = self.compression
+
+        result = {"status": None, "headers": None, "body": None,
+                "elapsed": None, "error": None}
+        start = time.perf_counter()
+        try:
+            if self.doPost:
+                request = session.post(url, headers = headers, data = data)
+            else:
+                request = session.get(url, headers = headers)
+            async with request as resp:
+                result["body"] = await resp.read()
+                result["status"] = resp.status
+                result["headers"] = dict(resp.headers)
+        except Exception as e:
+            result["error"] = "{}: {}".format(type(e).__name__, e)
+        result["elapsed"] = time.perf_counter() - start
+
+        if waitTime:
+            await asyncio.sleep(waitTime)
+        return result
+
+    async def iter_requests(self, datas=None, count=None, rate=None,
+            deadline=None):
+        """
+        note   : Launch requests with at most "concurrency" in flight, and
+                 yield results as they finish.
+        param  :
+            datas   : Iterable of post bodies, None items use self.data.
+                      Requests are repeated with self.data if None.
+            count   : Count of requests, all of datas if None.
+            rate    : Requests started per second, no limit if None.
+            deadline: Event loop time to stop at, None for no limit. No
+                      request starts after it, and requests in flight at it
+                      are cancelled and yielded with a "TimeoutError".
+        return : Async iterator of result dicts of launch_request_async, with
+                 "index" of the request and its "latency". With a rate, the
+                 latency is counted from the scheduled start, so waiting for
+                 a free worker is included, otherwise it equals "elapsed".
+        """
+        if datas is None:
+            datas = itertools.repeat(None)
+        items = enumerate(datas)
+        if count is not None:
+            items = itertools.islice(items, count)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        # Results of finished requests, None when a worker exits.
+        queue = asyncio.Queue(maxsize = self.concurrency)
+        errors = []
+
+        async def worker():
+            try:
+                for index, data in items:
+                    scheduled = None
+                    if rate:
+                        scheduled = start + index / rate
+                        if deadline is not None and scheduled >= deadline:
+                            break
+                        delay = scheduled - loop.time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    if deadline is None:
+                        result = await self.launch_request_async(data)
+                    elif loop.time() >= deadline:
+                        break
+                    else:
+                        result = await self._launch_until(data, deadline)
+                    result["index"] = index
+                    if scheduled is None:
+                        result["latency"] = result["elapsed"]
+                    else:
+                        result["latency"] = loop.time() - scheduled
+                    await queue.put(result)
+            except Exception as e:
+                # Raised by datas, requests errors are in results.
+                errors.append(e)
+            await queue.put(None)
+
+        await self.open()
+        workers = [asyncio.ensure_future(worker())
+                for _ in range(self.concurrency)]
+        try:
+            running = len(workers)
+            while running:
+                result = await queue.get()
+                if result is None:
+                    running -= 1
+                    continue
+                yield result
+            if errors:
+                raise errors[0]
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions = True)
+
+    async def _launch_until(self, data, deadline):
+        """
+        Launch one request, cancel it at deadline of event loop time.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            return await asyncio.wait_for(self.launch_request_async(data),
+                    deadline - started)
+        except asyncio.TimeoutError:
+            return {"status": None, "headers": None, "body": None,
+                    "elapsed": loop.time() - started,
+                    "error": "TimeoutError: in flight at deadline"}
+
+    def run_requests(self, datas=None, count=None, rate=None):
+        """
+        Launch requests as iter_requests in a new event loop, return the
+        list of results in order of finishing.
+        """
+        async def run():
+            try:
+                return [result async for result in
+                        self.iter_requests(datas, count, rate)]
+            finally:
+                await self.close()
+
+        return asyncio.run(run())
@@ -1,14 +1,33 @@
 # -*- coding: utf-8 -*-
 
+import concurrent.futures
 import difflib
+import hashlib
+import heapq
+import itertools
 import json
 import os
+import re
+import tempfile
+import time
 
 _TYPE_STR = type(str())
 _TYPE_BYTES = type(bytes())
 _TYPE_DICT = type(dict())
 _TYPE_LIST = type(list())
 
+_DIGEST_SIZE = 16
+_DIGEST_MOD = 1 << (_DIGEST_SIZE * 8)
+_SCALAR_TYPES = frozenset([str, int, float, bool, type(None)])
+_CONTAINER_TYPES = frozenset([_TYPE_LIST, _TYPE_DICT])
+_JSON_ENCODE = json.JSONEncoder(sort_keys = True, ensure_ascii = False,
+        check_circular = False).encode
+
+_STREAM_CHUNK_SIZE = 1 << 20
+_STREAM_MEMORY_LIMIT = 64 << 20
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_JSON_NUMBER_CHARS = ".eE+-0123456789"
+
 def _is_str(inputData):
     """
     note   : Return if input data is a instance of "str".
@@ -113,6 +132,725 @@ def _get_sort_key(inputData):
     return result
 
 
+def _compile_path_globs(globs):
+    """
+    note   : Compile json-path globs to one regex.
+             "*" matches inside one key, "[*]" matches any list index and
+             "**" matches anything, e.g. "$.items[*].ts", "$.**.updated".
+             ".**" matches zero or more keys or indexes, so "$.**.ts" also
+             matches "$.ts" and "$[0].ts".
+    param  :
+        globs   : Iterable of json-path globs.
+    return : Compiled regex, None if no globs.
+    """
+    patterns = []
+    for glob in globs:
+        pattern = ""
+        for part in re.split(r"(\*\*|\[\*\]|\*)", glob):
+            if part == "**" and pattern.endswith(r"\."):
+                pattern = pattern[:-2] + r"(?:[.\[].*)?"
+            elif part == "**":
+                pattern += ".*"
+            elif part == "[*]":
+                pattern += r"\[\d+\]"
+            elif part == "*":
+                pattern += r"[^.\[]*"
+            else:
+                pattern += re.escape(part)
+        patterns.append("(?:{})".format(pattern))
+
+    if not patterns:
+        return None
+    return re.compile("(?:{})\\Z".format("|".join(patterns)))
+
+
+class CompareRules():
+    """
+    Comparison rules applied while canonicalizing data.
+    Paths are json-paths like "$.items[3].ts" and are matched with globs.
+    """
+    def __init__(self, ignorePaths=(), orderedPaths=(), floatTolerance=None,
+            tolerances=None):
+        """
+        Initialization.
+        param  :
+            ignorePaths     : Globs of paths to drop before comparing.
+            orderedPaths    : Globs of lists to compare in order.
+            floatTolerance  : Tolerance of all floats, None for exact.
+            tolerances      : Dict of glob to tolerance, checked in order
+                              before floatTolerance.
+        Floats within their tolerance of each other compare equal, ints stay
+        exact. Canonical forms, sort keys and digests bucket floats to
+        multiples of their tolerance instead, see apply_tolerance.
+        """
+        # Identifies the rules in caches of canonical forms. Tolerances are
+        # kept in order, the first matching glob wins.
+        self.fingerprint = repr([sorted(ignorePaths), sorted(orderedPaths),
+                floatTolerance, list((tolerances or {}).items())])
+        self._ignored = _compile_path_globs(ignorePaths)
+        self._ordered = _compile_path_globs(orderedPaths)
+        self._floatTolerance = floatTolerance
+        self._tolerances = [(_compile_path_globs([glob]), tolerance)
+                for glob, tolerance in (tolerances or {}).items()]
+
+    def is_ignored(self, path):
+        """
+        Return if path is ignored.
+        """
+        return self._ignored is not None and bool(self._ignored.match(path))
+
+    def is_ordered(self, path):
+        """
+        Return if list at path is ordered.
+        """
+        return self._ordered is not None and bool(self._ordered.match(path))
+
+    def get_tolerance(self, path):
+        """
+        Return tolerance of float at path, None for exact.
+        """
+        for regex, tolerance in self._tolerances:
+            if regex.match(path):
+                return tolerance
+        return self._floatTolerance
+
+    def has_tolerance(self):
+        """
+        Return if any float is compared with a tolerance.
+        """
+        return bool(self._floatTolerance or self._tolerances)
+
+    def apply_tolerance(self, value, path):
+        """
+        Return float bucketed to the nearest multiple of its tolerance.
+        Floats in one bucket are within tolerance of each other, but floats
+        within tolerance may fall in neighbouring buckets, so buckets only
+        serve canonical forms and is_close decides equality.
+        """
+        tolerance = self.get_tolerance(path)
+        if not tolerance:
+            return value
+        return round(value / tolerance) * tolerance
+
+    def is_close(self, valueA, valueB, path):
+        """
+        Return if two floats at path are equal within their tolerance.
+        """
+        tolerance = self.get_tolerance(path)
+        if not tolerance:
+            return valueA == valueB
+        return abs(valueA - valueB) <= tolerance
+
+
+def _child_path(path, key):
+    """
+    Return json-path of a dict member, None if path is None.
+    """
+    if path is None:
+        return None
+    return "{}.{}".format(path, key)
+
+
+def _index_path(path, index):
+    """
+    Return json-path of a list element, None if path is None.
+    """
+    if path is None:
+        return None
+    return "{}[{}]".format(path, index)
+
+
+class DataCanonicalizer():
+    """
+    Canonicalize python data for comparisons.
+    Sort keys are built once, bottom-up, for list elements and their
+    subtrees only, and reused by their parents.
+    Optional CompareRules are applied within the same pass.
+    """
+    def __init__(self, rules=None):
+        """
+        Initialization.
+        """
+        self.rules = rules
+
+    def _root_path(self):
+        """
+        Return json-path of root, None if paths are not needed.
+        """
+        if self.rules is None:
+            return None
+        return "$"
+
+    def canonicalize(self, inputData):
+        """
+        note   : Sort lists in input data recursively.
+        param  :
+            inputData   : Input data.
+        return : Sorted data(copy).
+        """
+        return self._canonicalize(inputData, self._root_path())
+
+    def get_sort_key(self, inputData):
+        """
+        note   : Return the sort key of input data, as _get_sort_key does.
+        param  :
+            inputData   : Input data.
+        return : Sort key.
+        """
+        return self._canonicalize_keyed(inputData, self._root_path())[1]
+
+    def get_digest(self, inputData):
+        """
+        note   : Return the structural digest of input data.
+                 Lists are hashed as multisets, so two inputs get the same
+                 digest when they are equal after canonicalization.
+        param  :
+            inputData   : Input data.
+        return : Digest(bytes).
+        """
+        return self._digest(inputData, self._root_path())
+
+    def iter_diff(self, inDataA, inDataB):
+        """
+        note   : Walk two inputs together and yield their differences.
+                 Identical subtrees are skipped by digest and list elements
+                 are matched by sort key instead of by position.
+        param  :
+            inDataA     : Input data.
+            inDataB     : Another input data.
+        return : Generator of (path, kind, old, new), kind is one of
+                 "added", "removed" or "changed".
+        Digests of containers are computed once and dropped as soon as
+        their node has been walked, so the walk takes linear time.
+        """
+        return self._iter_diff("$", inDataA, inDataB, {})
+
+    def _is_ignored(self, path):
+        return path is not None and self.rules.is_ignored(path)
+
+    def _is_ordered(self, path):
+        return path is not None and self.rules.is_ordered(path)
+
+    def _leaf(self, inputData, path):
+        """
+        Return leaf value after rules.
+        """
+        if path is not None and type(inputData) == float:
+            return self.rules.apply_tolerance(inputData, path)
+        return inputData
+
+    def _iter_diff(self, path, nodeA, nodeB, memo, differ=False):
+        """
+        note   : Yield differences between two nodes.
+        param  :
+            path    : Json-path of the nodes.
+            nodeA   : One node.
+            nodeB   : Another node.
+            memo    : Digests of containers, see _digest.
+            differ  : Whether digests of the nodes are known to differ.
+        """
+        rulePath = path if self.rules is not None else None
+        if differ or self._digest(nodeA, rulePath, memo) != \
+                self._digest(nodeB, rulePath, memo):
+            yield from self._iter_node_diff(path, nodeA, nodeB, memo)
+        self._forget(nodeA, rulePath, memo)
+        self._forget(nodeB, rulePath, memo)
+
+    def _iter_node_diff(self, path, nodeA, nodeB, memo):
+        """
+        Yield differences between two nodes known to differ.
+        """
+        rulePath = path if self.rules is not None else None
+
+        if _is_dict(nodeA) and _is_dict(nodeB):
+            for key in sorted(set(nodeA) | set(nodeB), key = str):
+                subPath = "{}.{}".format(path, key)
+                if self._is_ignored(_child_path(rulePath, key)):
+                    continue
+                if key not in nodeB:
+                    yield subPath, "removed", nodeA[key], None
+                elif key not in nodeA:
+                    yield subPath, "added", None, nodeB[key]
+                else:
+                    yield from self._iter_diff(subPath, nodeA[key], nodeB[key],
+                            memo)
+        elif _is_list(nodeA) and _is_list(nodeB):
+            if self._is_ordered(rulePath):
+                yield from self._iter_ordered_list_diff(path, nodeA, nodeB,
+                        memo)
+            else:
+                yield from self._iter_list_diff(path, nodeA, nodeB, memo)
+        elif not self._is_close(nodeA, nodeB, rulePath):
+            yield path, "changed", nodeA, nodeB
+
+    def _is_close(self, nodeA, nodeB, path):
+        """
+        Return if two leaves are floats within tolerance.
+        """
+        return path is not None and type(nodeA) == float and \
+                type(nodeB) == float and self.rules.is_close(nodeA, nodeB, path)
+
+    def _iter_ordered_list_diff(self, path, listA, listB, memo):
+        """
+        note   : Yield differences between two lists by position.
+        param  :
+            path    : Json-path of the lists.
+            listA   : One list.
+            listB   : Another list.
+            memo    : Digests of containers, see _digest.
+        """
+        indexesA = [i for i in range(len(listA))
+                if not self._is_ignored(_index_path(path, i))]
+        indexesB = [i for i in range(len(listB))
+                if not self._is_ignored(_index_path(path, i))]
+        for i, j in zip(indexesA, indexesB):
+            yield from self._iter_diff("{}[{}]".format(path, i),
+                    listA[i], listB[j], memo)
+        for i in indexesA[len(indexesB):]:
+            yield "{}[{}]".format(path, i), "removed", listA[i], None
+        for j in indexesB[len(indexesA):]:
+            yield "{}[{}]".format(path, j), "added", None, listB[j]
+
+    def _iter_list_diff(self, path, listA, listB, memo):
+        """
+        note   : Yield differences between two lists, matching by sort key.
+                 Sort keys of the elements are only kept while matching
+                 them, not while walking into the unmatched pairs.
+        param  :
+            path    : Json-path of the lists.
+            listA   : One list.
+            listB   : Another list.
+            memo    : Digests of containers, see _digest.
+        """
+        for i, j in self._match_list(path, listA, listB, memo):
+            if j is None:
+                yield "{}[{}]".format(path, i), "removed", listA[i], None
+            elif i is None:
+                yield "{}[{}]".format(path, j), "added", None, listB[j]
+            else:
+                yield from self._iter_diff("{}[{}]".format(path, i),
+                        listA[i], listB[j], memo, True)
+
+    def _match_list(self, path, listA, listB, memo):
+        """
+        note   : Match elements of two lists by sort key, identical elements
+                 first and the rest by order.
+        param  :
+            path    : Json-path of the lists.
+            listA   : One list.
+            listB   : Another list.
+            memo    : Digests of containers, see _digest.
+        return : List of (index in listA, index in listB) of the differing
+                 elements, None for an element without counterpart.
+        """
+        rulePath = path if self.rules is not None else None
+
+        def group(inputList):
+            groups = {}
+            digests = {}
+            for i, e in enumerate(inputList):
+                subPath = _index_path(rulePath, i)
+                if self._is_ignored(subPath):
+                    continue
+                groups.setdefault(self._sort_key(e, subPath), []).append(i)
+                digests[i] = self._digest(e, subPath, memo)
+            return groups, digests
+
+        groupsA, digestsA = group(listA)
+        groupsB, digestsB = group(listB)
+
+        result = []
+        for key in sorted(set(groupsA) | set(groupsB)):
+            indexesA = groupsA.get(key, [])
+            indexesB = groupsB.get(key, [])
+
+            byDigest = {}
+            for i in indexesB:
+                byDigest.setdefault(digestsB[i], []).append(i)
+            restA = []
+            for i in indexesA:
+                same = byDigest.get(digestsA[i])
+                if same:
+                    same.pop(0)
+                else:
+                    restA.append(i)
+            restB = sorted([i for v in byDigest.values() for i in v])
+
+            result.extend(zip(restA, restB))
+            result.extend((i, None) for i in restA[len(restB):])
+            result.extend((None, j) for j in restB[len(restA):])
+
+        if rulePath is not None and self.rules.has_tolerance():
+            result = self._match_close(path, listA, listB, result, memo)
+        return result
+
+    def _match_close(self, path, listA, listB, pairs, memo):
+        """
+        note   : Match differing elements having a counterpart within
+                 tolerance, which sort keys may put in another bucket.
+                 Elements already matched in one bucket stay matched.
+        param  :
+            path    : Json-path of the lists.
+            listA   : One list.
+            listB   : Another list.
+            pairs   : Result of _match_list.
+            memo    : Digests of containers, see _digest.
+        return : Pairs of the elements left differing.
+        """
+        restA = [i for i, j in pairs if i is not None]
+        restB = [j for i, j in pairs if j is not None]
+        closeTo = {}
+        for i in restA:
+            subPath = "{}[{}]".format(path, i)
+            closeTo[i] = [j for j in restB if next(self._iter_diff(subPath,
+                    listA[i], listB[j], memo), None) is None]
+
+        # Maximum matching by augmenting paths, a greedy match may take the
+        # only counterpart of another element.
+        matchOf = {}
+        def augment(i, seen):
+            for j in closeTo[i]:
+                if j not in seen:
+                    seen.add(j)
+                    if j not in matchOf or augment(matchOf[j], seen):
+                        matchOf[j] = i
+                        return True
+            return False
+
+        for i in restA:
+            if closeTo[i]:
+                augment(i, set())
+        closeA = set(matchOf.values())
+        closeB = set(matchOf)
+
+        result = []
+        for i, j in pairs:
+            if i in closeA:
+                i = None
+            if j in closeB:
+                j = None
+            if i is not None or j is not None:
+                result.append((i, j))
+        return result
+
+    def _digest(self, inputData, path, memo=None):
+        """
+        note   : Merkle-style digest of one node.
+        param  :
+            inputData   : Input data.
+            path        : Json-path of the node, None without rules.
+            memo        : Optional dict keeping digests of containers by
+                          (id, path), dropped by _forget.
+        return : Digest(bytes).
+        """
+        if memo is None or type(inputData) not in _CONTAINER_TYPES:
+            return self._digest_node(inputData, path, memo)
+
+        key = (id(inputData), path)
+        digest = memo.get(key)
+        if digest is None:
+            digest = memo[key] = self._digest_node(inputData, path, memo)
+        return digest
+
+    def _forget(self, inputData, path, memo):
+        """
+        Drop digests of a node and its descendants from memo.
+        Descendants of a node not in memo are not in it either.
+        """
+        if type(inputData) not in _CONTAINER_TYPES:
+            return
+        found = memo.pop((id(inputData), path), None) is not None
+        if path is None:
+            found = memo.pop((id(inputData), False), None) is not None or found
+        if not found:
+            return
+
+        if _is_list(inputData):
+            for i, e in enumerate(inputData):
+                if type(e) in _CONTAINER_TYPES:
+                    self._forget(e, _index_path(path, i), memo)
+        else:
+            for key, value in inputData.items():
+                if type(value) in _CONTAINER_TYPES:
+                    self._forget(value, _child_path(path, key), memo)
+
+    def _digest_node(self, inputData, path, memo):
+        """
+        Compute digest of one node, children are digested by _digest.
+        """
+        if path is None:
+            digest = self._digest_plain(inputData, memo)
+            if digest is not None:
+                return digest
+
+        if _is_list(inputData):
+            if self._is_ordered(path):
+                h = hashlib.blake2b(digest_size = _DIGEST_SIZE)
+                count = 0
+                for i, e in enumerate(inputData):
+                    subPath = _index_path(path, i)
+                    if self._is_ignored(subPath):
+                        continue
+                    h.update(self._digest(e, subPath, memo))
+                    count += 1
+                return _hash_bytes(b"o", b"%d:" % count, h.digest())
+
+            total = 0
+            count = 0
+            for i, e in enumerate(inputData):
+                subPath = _index_path(path, i)
+                if self._is_ignored(subPath):
+                    continue
+                total += int.from_bytes(self._digest(e, subPath, memo),
+                        "little")
+                count += 1
+            return _hash_node(b"l", count, total)
+        elif _is_dict(inputData):
+            total = 0
+            count = 0
+            for key, value in inputData.items():
+                subPath = _child_path(path, key)
+                if self._is_ignored(subPath):
+                    continue
+                k = str(key).encode("utf-8", "surrogatepass")
+                total += int.from_bytes(_hash_bytes(b"%d:" % len(k), k,
+                        self._digest(value, subPath, memo)), "little")
+                count += 1
+            return _hash_node(b"d", count, total)
+        else:
+            inputData = self._leaf(inputData, path)
+            return _hash_bytes("s{}:{!r}".format(type(inputData).__name__,
+                    inputData).encode("utf-8", "surrogatepass"))
+
+    def _digest_plain(self, inputData, memo=None):
+        """
+        note   : Digest of a node without rules, hashed from C-level json
+                 encodings. Child containers of a dict are encoded as
+                 [hex digest], which no scalar member encodes to.
+        param  :
+            inputData   : Input data.
+            memo        : Optional digests of containers, see _digest.
+        return : Digest(bytes), None if the node is not plain json.
+        """
+        typeInput = type(inputData)
+        if typeInput == _TYPE_DICT:
+            if _SCALAR_TYPES.issuperset(map(type, inputData.values())):
+                flat = inputData
+            else:
+                flat = dict(inputData)
+                for key, value in inputData.items():
+                    typeValue = type(value)
+                    if typeValue in _CONTAINER_TYPES:
+                        digest = self._digest_plain_child(value, memo)
+                        if digest is None:
+                            return None
+                        flat[key] = [digest.hex()]
+                    elif typeValue not in _SCALAR_TYPES:
+                        return None
+            try:
+                return _hash_bytes(b"j" + _JSON_ENCODE(flat).encode(
+                        "utf-8", "surrogatepass"))
+            except TypeError:
+                # Keys of mixed types could not be sorted.
+                return None
+        elif typeInput == _TYPE_LIST:
+            if _SCALAR_TYPES.issuperset(map(type, inputData)):
+                return _hash_bytes(b"L%d:" % len(inputData), "\0".join(
+                        sorted(map(repr, inputData))).encode(
+                                "utf-8", "surrogatepass"))
+            total = 0
+            for e in inputData:
+                digest = self._digest_plain_child(e, memo)
+                if digest is None:
+                    return None
+                total += int.from_bytes(digest, "little")
+            return _hash_node(b"l", len(inputData), total)
+        elif typeInput in _SCALAR_TYPES:
+            return _hash_bytes("s{}:{!r}".format(typeInput.__name__,
+                    inputData).encode("utf-8", "surrogatepass"))
+        return None
+
+    def _digest_plain_child(self, inputData, memo):
+        """
+        Return _digest_plain of a child, kept in memo if it is a container.
+        Kept apart from _digest, which falls back to other digests.
+        """
+        if memo is None or type(inputData) not in _CONTAINER_TYPES:
+            return self._digest_plain(inputData)
+
+        key = (id(inputData), False)
+        digest = memo.get(key)
+        if digest is None:
+            digest = self._digest_plain(inputData, memo)
+            if digest is not None:
+                memo[key] = digest
+        return digest
+
+    def _sort_key(self, inputData, path):
+        """
+        note   : Sort key of one node, as _canonicalize_keyed returns it,
+                 without building the sorted copy.
+        param  :
+            inputData   : Input data.
+            path        : Json-path of the node, None without rules.
+        return : Sort key.
+        """
+        if _is_list(inputData):
+            keys = []
+            for i, e in enumerate(inputData):
+                subPath = _index_path(path, i)
+                if not self._is_ignored(subPath):
+                    keys.append(self._sort_key(e, subPath))
+            if not self._is_ordered(path):
+                keys.sort()
+            return "".join(keys)
+        elif _is_dict(inputData):
+            keys = []
+            for k in sorted(inputData):
+                subPath = _child_path(path, k)
+                if not self._is_ignored(subPath):
+                    keys.append(self._sort_key(inputData[k], subPath))
+            return "".join(keys)
+        else:
+            return str(self._leaf(inputData, path))
+
+    def _canonicalize(self, inputData, path):
+        """
+        note   : Canonicalize one node, without building its sort key.
+        param  :
+            inputData   : Input data.
+            path        : Json-path of the node, None without rules.
+        return : Sorted copy.
+        """
+        typeInput = type(inputData)
+        if typeInput == _TYPE_LIST:
+            return self._canonicalize_list(inputData, path)[0]
+        elif typeInput == _TYPE_DICT:
+            return self._canonicalize_dict(inputData, path)
+        elif path is None:
+            return inputData
+        else:
+            return self._leaf(inputData, path)
+
+    def _canonicalize_keyed(self, inputData, path):
+        """
+        note   : Canonicalize one node and build its sort key.
+                 Sort keys are only needed below list elements.
+        param  :
+            inputData   : Input data.
+            path        : Json-path of the node, None without rules.
+        return : (sorted copy, sort key)
+        """
+        typeInput = type(inputData)
+        if typeInput == _TYPE_LIST:
+            result, keys = self._canonicalize_list(inputData, path)
+            return result, "".join(keys)
+        elif typeInput == _TYPE_DICT:
+            tmpDict = {}
+            keys = {}
+            for key, value in inputData.items():
+                if path is not None:
+                    subPath = _child_path(path, key)
+                    if not self.rules.is_ignored(subPath):
+                        tmpDict[key], keys[key] = self._canonicalize_keyed(
+                                value, subPath)
+                elif type(value) in _CONTAINER_TYPES:
+                    tmpDict[key], keys[key] = self._canonicalize_keyed(
+                            value, None)
+                else:
+                    tmpDict[key] = value
+                    keys[key] = str(value)
+            return tmpDict, "".join([keys[k] for k in sorted(keys)])
+        elif path is None:
+            return inputData, str(inputData)
+        else:
+            inputData = self._leaf(inputData, path)
+            return inputData, str(inputData)
+
+    def _canonicalize_list(self, inputList, path):
+        """
+        note   : Canonicalize a list, sorting elements by their cached keys.
+        param  :
+            inputList   : Input list.
+            path        : Json-path of the list, None without rules.
+        return : (sorted copy, sort keys of its elements in order)
+        """
+        if path is None:
+            pairs = [self._canonicalize_keyed(e, None) for e in inputList]
+        else:
+            pairs = []
+            for i, e in enumerate(inputList):
+                subPath = _index_path(path, i)
+                if not self.rules.is_ignored(subPath):
+                    pairs.append(self._canonicalize_keyed(e, subPath))
+
+        if not self._is_ordered(path):
+            # sorted() is stable, so equal keys keep their input order.
+            pairs.sort(key = lambda x:x[1])
+        return [p[0] for p in pairs], [p[1] for p in pairs]
+
+    def _canonicalize_dict(self, inputDict, path):
+        """
+        note   : Canonicalize a dict, which is not a list element.
+        param  :
+            inputDict   : Input dict.
+            path        : Json-path of the dict, None without rules.
+        return : Sorted copy.
+        """
+        canonicalize = self._canonicalize
+        if path is None:
+            return {key: canonicalize(value, None)
+                    for key, value in inputDict.items()}
+
+        tmpDict = {}
+        for key, value in inputDict.items():
+            subPath = _child_path(path, key)
+            if not self.rules.is_ignored(subPath):
+                tmpDict[key] = canonicalize(value, subPath)
+        return tmpDict
+
+
+def _hash_bytes(*parts):
+    """
+    note   : Hash byte strings.
+    param  :
+        parts   : Byte strings.
+    return : Digest(bytes).
+    """
+    if len(parts) == 1:
+        return hashlib.blake2b(parts[0], digest_size = _DIGEST_SIZE).digest()
+
+    h = hashlib.blake2b(digest_size = _DIGEST_SIZE)
+    for part in parts:
+        h.update(part)
+    return h.digest()
+
+
+def _hash_node(tag, length, total):
+    """
+    note   : Hash a container from its multiset sum of child digests.
+    param  :
+        tag     : Container tag.
+        length  : Count of children.
+        total   : Sum of child digests.
+    return : Digest(bytes).
+    """
+    return _hash_bytes(tag, b"%d:" % length,
+            (total % _DIGEST_MOD).to_bytes(_DIGEST_SIZE, "little"))
+
+
+_CANONICALIZER = DataCanonicalizer()
+
+
+def _get_canonicalizer(rules):
+    """
+    Return the canonicalizer applying rules.
+    """
+    if rules is None:
+        return _CANONICALIZER
+    return DataCanonicalizer(rules)
+
+
 def _sort_list(inputList):
     """
     note   : Sort input list.
@@ -120,22 +858,7 @@ def _sort_list(inputList):
         inputData   : Input list.
     return : Sorted list(copy).
     """
-    length = len(inputList)
-    tmpList_A = []
-    midMap = {}
-    for i in range(length):
-        tmpList_A.append(_sort_list_in_data(inputList[i]))
-        midMap[i] = _get_sort_key(tmpList_A[i])
-
-    sortedIndex = sorted(\
-            midMap.items(), \
-            key = lambda x:x[1], \
-            reverse = False)
-    tmpList_B = []
-    for pair in sortedIndex:
-        tmpList_B.append(tmpList_A[pair[0]])
-
-    return tmpList_B
+    return _CANONICALIZER.canonicalize(inputList)
 
 
 def _sort_dict(inputDict):
@@ -145,18 +868,7 @@ def _sort_dict(inputDict):
         inputData   : Input dict.
     return : Sorted dict(copy).
     """
-    tmpDict = {}
-    for key, value in inputDict.items():
-        if _is_list(value):
-            sortedValue = _sort_list(value)
-        elif _is_dict(value):
-            sortedValue = _sort_dict(value)
-        else:
-            sortedValue = value
-
-        tmpDict[key] = sortedValue
-
-    return tmpDict
+    return _CANONICALIZER.canonicalize(inputDict)
 
 
 def _sort_list_in_data(inputData):
@@ -166,18 +878,14 @@ def _sort_list_in_data(inputData):
         inputData   : Input data.
     return : Sorted data(copy).
     """
-    if _is_list(inputData):
-        return _sort_list(inputData)
-    elif _is_dict(inputData):
-        return _sort_dict(inputData)
-    else:
-        return inputData
+    return _CANONICALIZER.canonicalize(inputData)
 
 
-def compare_data(inData_A, inData_B, diffFilePrefix):
+def _compare_data(canonicalizer, inData_A, inData_B, diffFilePrefix):
     """
     note   : Sort and compre if inData_A equals to inData_B.
     param  :
+        canonicalizer   : DataCanonicalizer to use.
         inData_A   : Input data.
         inData_B   : Another input data.
         diffFilePrefix  : Output diff file prefix.
@@ -185,16 +893,61 @@ def compare_data(inData_A, inData_B, diffFilePrefix):
         True    : inData_A equals to inData_B.
         False   : inData_A does NOT equals to inData_B.
     """
+    canonical_A = canonicalizer.canonicalize(inData_A)
+    canonical_B = canonicalizer.canonicalize(inData_B)
 
-    dict_A = _sort_list_in_data(inData_A)
-    dict_B = _sort_list_in_data(inData_B)
+    # "==" runs in C and stops at the first difference, so unequal inputs go
+    # straight to dumping. It takes 1, 1.0 and True as equal, the compact
+    # encodings tell them apart without building the indented dumps.
+    if canonical_A == canonical_B and \
+            _JSON_ENCODE(canonical_A) == _JSON_ENCODE(canonical_B):
+        return True
 
-    str_A = json.dumps(dict_A, indent = 4, sort_keys=True, ensure_ascii=False)
-    str_B = json.dumps(dict_B, indent = 4, sort_keys=True, ensure_ascii=False)
+    # Floats within tolerance may fall in neighbouring buckets.
+    rules = canonicalizer.rules
+    if rules is not None and rules.has_tolerance() and \
+            next(canonicalizer.iter_diff(inData_A, inData_B), None) is None:
+        return True
+
+    str_A = json.dumps(canonical_A, indent = 4, sort_keys=True,
+            ensure_ascii=False)
+    str_B = json.dumps(canonical_B, indent = 4, sort_keys=True,
+            ensure_ascii=False)
 
     if str_A == str_B:
         return True
 
+    _write_diff_files(diffFilePrefix, str_A, str_B)
+    return False
+
+
+def _dump_canonical(canonicalizer, inputData):
+    """
+    note   : Dump the canonical form of input data.
+    param  :
+        canonicalizer   : DataCanonicalizer to use.
+        inputData       : Input data.
+    return : Json string.
+    """
+    return json.dumps(canonicalizer.canonicalize(inputData),
+            indent = 4, sort_keys=True, ensure_ascii=False)
+
+
+def _hash_canonical(str_A):
+    """
+    Return hash of a canonical json string in hex.
+    """
+    return _hash_bytes(b"c", str_A.encode("utf-8", "surrogatepass")).hex()
+
+
+def _write_diff_files(diffFilePrefix, str_A, str_B):
+    """
+    note   : Write dumped inputs to diff files.
+    param  :
+        diffFilePrefix  : Output diff file prefix.
+        str_A   : Dumped input.
+        str_B   : Another dumped input.
+    """
     fileName = "{}_1.data".format(diffFilePrefix)
     with open(fileName, "w") as f:
         f.write(str_A)
@@ -203,7 +956,84 @@ def compare_data(inData_A, inData_B, diffFilePrefix):
     with open(fileName, "w") as f:
         f.write(str_B)
 
-    return False
+
+def compare_data(inData_A, inData_B, diffFilePrefix, rules=None):
+    """
+    note   : Sort and compre if inData_A equals to inData_B.
+    param  :
+        inData_A   : Input data.
+        inData_B   : Another input data.
+        diffFilePrefix  : Output diff file prefix.
+        rules      : Optional CompareRules.
+    return :
+        True    : inData_A equals to inData_B.
+        False   : inData_A does NOT equals to inData_B.
+    """
+    return _compare_data(_get_canonicalizer(rules),
+            inData_A, inData_B, diffFilePrefix)
+
+
+def get_data_digest(inputData, rules=None):
+    """
+    note   : Return the order-insensitive structural digest of input data.
+    param  :
+        inputData   : Input data.
+        rules       : Optional CompareRules.
+    return : Digest in hex.
+    """
+    return _get_canonicalizer(rules).get_digest(inputData).hex()
+
+
+def iter_data_diff(inDataA, inDataB, rules=None):
+    """
+    note   : Yield the structural differences of two inputs.
+    param  :
+        inDataA     : one input data
+        inDataB     : another input data
+        rules       : Optional CompareRules.
+    return : Generator of (path, kind, old, new).
+    """
+    return _get_canonicalizer(rules).iter_diff(inDataA, inDataB)
+
+
+def get_data_diff(inDataA, inDataB, rules=None):
+    """
+    note   : Return the structural differences of two inputs.
+    param  :
+        inDataA     : one input data
+        inDataB     : another input data
+        rules       : Optional CompareRules.
+    return : List of (path, kind, old, new).
+    """
+    return list(iter_data_diff(inDataA, inDataB, rules))
+
+
+def show_data_diff(inDataA, inDataB, rules=None):
+    """
+    note   : Show the structural differences of two inputs, one per line.
+    param  :
+        inDataA     : one input data
+        inDataB     : another input data
+        rules       : Optional CompareRules.
+    return :
+        True    : Inputs are equivalent.
+        False   : Inputs are different.
+    """
+    equivalent = True
+    for path, kind, old, new in iter_data_diff(inDataA, inDataB, rules):
+        equivalent = False
+        if kind == "added":
+            print("+ {}: {}".format(path, json.dumps(new, ensure_ascii=False)))
+        elif kind == "removed":
+            print("- {}: {}".format(path, json.dumps(old, ensure_ascii=False)))
+        else:
+            print("~ {}: {} -> {}".format(path,
+                    json.dumps(old, ensure_ascii=False),
+                    json.dumps(new, ensure_ascii=False)))
+
+    if equivalent:
+        print("Inputs are equivalent.")
+    return equivalent
 
 
 def show_stringlized_dict_diff(strA, strB):
@@ -242,24 +1072,623 @@ def show_dict_diff(inDataA, inDataB):
     show_stringlized_dict_diff(strA, strB)
 
 
-def compare_data_json(jsonFileA, jsonFileB):
+class _JsonItemReader():
     """
-    Compare two json files.
+    Read the top-level items of a json file incrementally.
+    Items of a root list are yielded as (None, value), members of a root dict
+    as (key, value) and a root scalar as (None, value). Only one item is held
+    in memory at a time.
+    """
+    def __init__(self, jsonFile, chunkSize=_STREAM_CHUNK_SIZE):
+        """
+        Initialization.
+        """
+        self.kind = None
+        self._file = open(jsonFile, "r", encoding = "utf-8")
+        self._chunkSize = chunkSize
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close input file.
+        """
+        self._file.close()
+
+    def __iter__(self):
+        c = self._peek()
+        if c == "[":
+            self.kind = "list"
+            self._pos += 1
+            if self._peek() == "]":
+                self._pos += 1
+                return
+            while True:
+                yield None, self._decode()
+                if self._next_separator("]"):
+                    return
+        elif c == "{":
+            self.kind = "dict"
+            self._pos += 1
+            if self._peek() == "}":
+                self._pos += 1
+                return
+            while True:
+                key = self._decode()
+                if not _is_str(key) or self._peek() != ":":
+                    raise ValueError("Invalid object key at {}.".format(
+                            self._file.name))
+                self._pos += 1
+                yield key, self._decode()
+                if self._next_separator("}"):
+                    return
+        else:
+            self.kind = "scalar"
+            yield None, self._decode()
+
+    def _next_separator(self, closing):
+        """
+        Consume "," or the closing char, return True at the closing char.
+        """
+        c = self._peek()
+        if c != "," and c != closing:
+            raise ValueError("Invalid json at {}.".format(self._file.name))
+        self._pos += 1
+        return c == closing
+
+    def _read(self, size):
+        """
+        Append next chunk to the buffer, dropping consumed chars.
+        """
+        if self._eof:
+            return False
+
+        data = self._file.read(size)
+        if not data:
+            self._eof = True
+            return False
+
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """
+        Skip whitespaces and return next char, "" at the end of file.
+        """
+        while True:
+            self._pos = _JSON_WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._read(self._chunkSize):
+                return ""
+
+    def _decode(self):
+        """
+        Decode next value, reading more input until it is complete.
+        """
+        size = self._chunkSize
+        while True:
+            self._peek()
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # A number may continue in next chunk, with its fraction or
+                # exponent if it was cut right before them.
+                if self._eof or self._buf[self._pos] not in "-0123456789" or \
+                        (end < len(self._buf) and
+                        self._buf[end] not in _JSON_NUMBER_CHARS):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+
+            # Grow reads geometrically so a big item is decoded in O(size).
+            if self._read(size):
+                size *= 2
+
+
+class _SortedJsonItems():
+    """
+    Canonicalized top-level items of a json file, sorted by match key.
+    Items of one match key keep their order in the file, as sorting the
+    whole data does. Items are spilled to sorted runs on disk once they
+    exceed memoryLimit.
+    """
+    def __init__(self, jsonFile, memoryLimit=_STREAM_MEMORY_LIMIT,
+            canonicalizer=_CANONICALIZER):
+        """
+        Initialization.
+        """
+        self.kind = None
+        self._runs = []
+        self._items = []
+
+        rootPath = canonicalizer._root_path()
+        ordered = canonicalizer._is_ordered(rootPath)
+        count = 0
+        size = 0
+        with _JsonItemReader(jsonFile) as reader:
+            for index, (key, value) in enumerate(reader):
+                if reader.kind == "list":
+                    path = _index_path(rootPath, index)
+                elif reader.kind == "dict":
+                    path = _child_path(rootPath, key)
+                else:
+                    path = rootPath
+                if canonicalizer._is_ignored(path):
+                    continue
+
+                if key is None:
+                    canonical, sortKey = canonicalizer._canonicalize_keyed(
+                            value, path)
+                else:
+                    canonical = canonicalizer._canonicalize(value, path)
+                if key is None and ordered:
+                    # Keep positions of an ordered root list.
+                    matchKey = "{:020d}".format(count)
+                elif key is None:
+                    matchKey = sortKey
+                else:
+                    matchKey = key
+
+                text = json.dumps(canonical, sort_keys = True,
+                        ensure_ascii = False, separators = (",", ":"))
+                self._items.append((matchKey, count, text))
+                count += 1
+                size += len(matchKey) + len(text)
+                if size >= memoryLimit:
+                    self._spill()
+                    size = 0
+            self.kind = reader.kind
+
+    def _spill(self):
+        """
+        Write buffered items to a sorted run on disk.
+        """
+        self._items.sort()
+        run = tempfile.TemporaryFile("w+", encoding = "utf-8")
+        for item in self._items:
+            run.write(json.dumps(item, ensure_ascii = False))
+            run.write("\n")
+        run.seek(0)
+        self._runs.append(run)
+        self._items = []
+
+    def __iter__(self):
+        self._items.sort()
+        runs = [(tuple(json.loads(line)) for line in run) for run in self._runs]
+        return heapq.merge(self._items, *runs)
+
+    def close(self):
+        """
+        Remove runs on disk.
+        """
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._items = []
+
+
+def _iter_matched_groups(itemsA, itemsB):
+    """
+    note   : Merge-join two sorted item streams by match key.
+    param  :
+        itemsA  : Sorted items.
+        itemsB  : Another sorted items.
+    return : Generator of (matchKey, itemsOfA, itemsOfB).
+    """
+    groupsA = itertools.groupby(itemsA, key = lambda x:x[0])
+    groupsB = itertools.groupby(itemsB, key = lambda x:x[0])
+    groupA = next(groupsA, None)
+    groupB = next(groupsB, None)
+    while groupA is not None or groupB is not None:
+        if groupB is None or (groupA is not None and groupA[0] < groupB[0]):
+            yield groupA[0], list(groupA[1]), []
+            groupA = next(groupsA, None)
+        elif groupA is None or groupB[0] < groupA[0]:
+            yield groupB[0], [], list(groupB[1])
+            groupB = next(groupsB, None)
+        else:
+            yield groupA[0], list(groupA[1]), list(groupB[1])
+            groupA = next(groupsA, None)
+            groupB = next(groupsB, None)
+
+
+def compare_data_json_streaming(jsonFileA, jsonFileB, diffFilePrefix="diff_",
+        memoryLimit=_STREAM_MEMORY_LIMIT, rules=None):
+    """
+    note   : Compare two json files without loading them fully.
+             Top-level items are parsed one at a time and canonicalized,
+             list items are matched by sort key and dict members by key.
+             Items of one sort key are compared in file order, as
+             compare_data does. Only differing items are written to the
+             diff files, or whole groups if only their order differs.
+             Floats are compared by the tolerance buckets of rules, see
+             CompareRules.apply_tolerance.
+    param  :
+        jsonFileA       : Input json file.
+        jsonFileB       : Another input json file.
+        diffFilePrefix  : Output diff file prefix.
+        memoryLimit     : Approximate bytes of items kept before spilling.
+        rules           : Optional CompareRules.
+    return :
+        True    : jsonFileA equals to jsonFileB.
+        False   : jsonFileA does NOT equals to jsonFileB.
     """
-    dictA = {}
-    dictB = {}
+    canonicalizer = _get_canonicalizer(rules)
+    itemsA = _SortedJsonItems(jsonFileA, memoryLimit, canonicalizer)
+    itemsB = _SortedJsonItems(jsonFileB, memoryLimit, canonicalizer)
+    sameKind = itemsA.kind == itemsB.kind
+    files = []
+    try:
+        for matchKey, groupA, groupB in _iter_matched_groups(itemsA, itemsB):
+            if sameKind and [x[2] for x in groupA] == [x[2] for x in groupB]:
+                continue
+
+            if sameKind:
+                # Drop items having an identical counterpart.
+                restB = {}
+                for item in groupB:
+                    restB[item[2]] = restB.get(item[2], 0) + 1
+                onlyA = []
+                for item in groupA:
+                    if restB.get(item[2]):
+                        restB[item[2]] -= 1
+                    else:
+                        onlyA.append(item)
+                onlyB = []
+                for item in groupB:
+                    if restB[item[2]]:
+                        restB[item[2]] -= 1
+                        onlyB.append(item)
+                if not onlyA and not onlyB:
+                    # Only the order of tied items differs.
+                    onlyA, onlyB = groupA, groupB
+            else:
+                onlyA, onlyB = groupA, groupB
+
+            if not files:
+                files.append(open("{}_1.data".format(diffFilePrefix), "w"))
+                files.append(open("{}_2.data".format(diffFilePrefix), "w"))
+            _write_diff_items(files[0], itemsA.kind, onlyA)
+            _write_diff_items(files[1], itemsB.kind, onlyB)
+    finally:
+        for f in files:
+            f.close()
+        itemsA.close()
+        itemsB.close()
+
+    # Roots of different kinds differ even when both are empty.
+    if not sameKind and not files:
+        _write_diff_files(diffFilePrefix, "", "")
+    return sameKind and not files
 
-    with open(jsonFileA, "r") as f:
+
+def _write_diff_items(f, kind, items):
+    """
+    note   : Write differing items to a diff file.
+    param  :
+        f       : Output file.
+        kind    : Kind of the root container.
+        items   : Items to write.
+    """
+    for matchKey, index, text in items:
+        value = json.loads(text)
+        if kind == "dict":
+            value = {matchKey: value}
+        f.write(json.dumps(value, indent = 4, sort_keys=True, ensure_ascii=False))
+        f.write("\n")
+
+
+def _load_json_file(jsonFile, strict=False):
+    """
+    Load json file, return {} if it could not be decoded.
+    Raise ValueError instead if "strict" is set.
+    """
+    with open(jsonFile, "r", encoding = "utf-8") as f:
         try:
-            dictA = json.load(f, encoding = 'utf-8')
+            return json.load(f)
         except Exception as e:
-            print("Error orrcured while decoding {}.".format(jsonFileA))
+            if strict:
+                raise ValueError("Error orrcured while decoding {}: {}".format(
+                        jsonFile, e))
+            print("Error orrcured while decoding {}.".format(jsonFile))
 
-    with open(jsonFileB, "r") as f:
+    return {}
+
+
+class CanonicalCache():
+    """
+    On-disk cache of canonical digests and forms of json files, so golden
+    files are not parsed again while they do not change.
+    Entries keep a hash of the canonical json string, enough to tell an
+    equal file without parsing the golden one; a differing file has it
+    parsed again to write diff files unless storeCanonical is set.
+    Entries are keyed by path, mtime, size, content hash and rules, and are
+    evicted least recently used first once they exceed maxBytes.
+    """
+    def __init__(self, cacheDir, maxBytes=1 << 30, storeCanonical=False):
+        """
+        Initialization.
+        param  :
+            cacheDir        : Directory of cache entries.
+            maxBytes        : Size limit of all entries.
+            storeCanonical  : Also store the canonical json string, used to
+                              write diff files without parsing the file.
+        """
+        self.cacheDir = os.path.abspath(cacheDir)
+        self.maxBytes = maxBytes
+        self.storeCanonical = storeCanonical
+        self._keys = {}
+        os.makedirs(self.cacheDir, exist_ok = True)
+
+    def _get_entry_file(self, jsonFile, rules):
+        """
+        Return entry file of json file.
+        """
+        path = os.path.abspath(jsonFile)
+        stat = os.stat(path)
+        fileKey = (path, stat.st_mtime_ns, stat.st_size)
+        if fileKey not in self._keys:
+            h = hashlib.blake2b(digest_size = _DIGEST_SIZE)
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(_STREAM_CHUNK_SIZE), b""):
+                    h.update(chunk)
+            self._keys[fileKey] = h.hexdigest()
+
+        fingerprint = rules.fingerprint if rules is not None else ""
+        entryKey = _hash_bytes(repr(fileKey).encode("utf-8", "surrogatepass"),
+                self._keys[fileKey].encode(), fingerprint.encode()).hex()
+        return os.path.join(self.cacheDir, entryKey + ".json")
+
+    def get(self, jsonFile, rules=None):
+        """
+        note   : Return cached entry of json file.
+        param  :
+            jsonFile    : Json file.
+            rules       : CompareRules of the entry.
+        return : Dict with "digest", "canonicalHash" and "canonical", None
+                 if missing.
+        """
+        entryFile = self._get_entry_file(jsonFile, rules)
         try:
-            dictB = json.load(f, encoding = 'utf-8')
-        except Exception as e:
-            print("Error orrcured while decoding {}.".format(jsonFileB))
+            with open(entryFile, "r", encoding = "utf-8") as f:
+                entry = json.load(f)
+            # Mark as recently used.
+            os.utime(entryFile)
+        except (OSError, ValueError):
+            return None
+
+        if "canonicalHash" not in entry:
+            # Written by an older version.
+            return None
+        return entry
+
+    def put(self, jsonFile, digest, canonical, rules=None):
+        """
+        note   : Store entry of json file.
+        param  :
+            jsonFile    : Json file.
+            digest      : Canonical digest in hex.
+            canonical   : Canonical json string, kept if storeCanonical.
+            rules       : CompareRules of the entry.
+        """
+        entry = {
+                "digest": digest,
+                "canonicalHash": _hash_canonical(canonical),
+                "canonical": canonical if self.storeCanonical else None,
+                }
+
+        entryFile = self._get_entry_file(jsonFile, rules)
+        tmpFile = "{}.{}.tmp".format(entryFile, os.getpid())
+        with open(tmpFile, "w", encoding = "utf-8") as f:
+            json.dump(entry, f, ensure_ascii = False)
+        os.replace(tmpFile, entryFile)
+
+        self._evict()
+
+    def _evict(self):
+        """
+        Remove least recently used entries beyond maxBytes.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.cacheDir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cacheDir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+            total += stat.st_size
+
+        entries.sort()
+        for mtime, size, name in entries:
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(os.path.join(self.cacheDir, name))
+            except OSError:
+                pass
+            total -= size
+
+
+def _compare_json_files(canonicalizer, jsonFileA, jsonFileB, diffFilePrefix,
+        cache=None, strict=False):
+    """
+    note   : Compare two json files, jsonFileA is looked up in cache.
+             Digests are only reported, equal digests do not make the files
+             equal: lists digest as multisets, while compare_data keeps the
+             order of items having the same sort key.
+    param  :
+        canonicalizer   : DataCanonicalizer to use.
+        jsonFileA       : Golden json file.
+        jsonFileB       : Another json file.
+        diffFilePrefix  : Output diff file prefix.
+        cache           : Optional CanonicalCache.
+        strict          : Raise ValueError on files not decoded.
+    return : (equal, digest of jsonFileA, digest of jsonFileB)
+    """
+    if cache is None:
+        dictA = _load_json_file(jsonFileA, strict)
+        dictB = _load_json_file(jsonFileB, strict)
+        digest_A = canonicalizer.get_digest(dictA)
+        digest_B = canonicalizer.get_digest(dictB)
+        return _compare_data(canonicalizer, dictA, dictB, diffFilePrefix), \
+                digest_A, digest_B
+
+    dictB = _load_json_file(jsonFileB, strict)
+    digest_B = canonicalizer.get_digest(dictB)
+    str_B = _dump_canonical(canonicalizer, dictB)
+
+    dictA = None
+    entry = cache.get(jsonFileA, canonicalizer.rules)
+    if entry is None:
+        dictA = _load_json_file(jsonFileA, strict)
+        digest_A = canonicalizer.get_digest(dictA)
+        str_A = _dump_canonical(canonicalizer, dictA)
+        cache.put(jsonFileA, digest_A.hex(), str_A, canonicalizer.rules)
+        equal = str_A == str_B
+    else:
+        digest_A = bytes.fromhex(entry["digest"])
+        str_A = entry["canonical"]
+        equal = entry["canonicalHash"] == _hash_canonical(str_B)
+
+    if equal:
+        return True, digest_A, digest_B
+
+    # Cached canonical floats are bucketed, tolerances need the data, as in
+    # _compare_data.
+    rules = canonicalizer.rules
+    if rules is not None and rules.has_tolerance():
+        if dictA is None:
+            dictA = _load_json_file(jsonFileA, strict)
+        if next(canonicalizer.iter_diff(dictA, dictB), None) is None:
+            return True, digest_A, digest_B
+
+    if str_A is None:
+        if dictA is None:
+            dictA = _load_json_file(jsonFileA, strict)
+        str_A = _dump_canonical(canonicalizer, dictA)
+
+    _write_diff_files(diffFilePrefix, str_A, str_B)
+    return False, digest_A, digest_B
+
+
+def compare_data_json(jsonFileA, jsonFileB, stream=False,
+        diffFilePrefix="diff_", rules=None, cache=None):
+    """
+    Compare two json files.
+    Set "stream" to compare huge files with bounded memory. It gives the
+    same answers, except that floats are compared by tolerance bucket:
+    with tolerances of rules, floats within tolerance but in neighbouring
+    buckets are reported as differing in stream mode only.
+    Set "cache" to a CanonicalCache to reuse the canonical form of the
+    golden file jsonFileA.
+    """
+    if stream:
+        return compare_data_json_streaming(jsonFileA, jsonFileB,
+                diffFilePrefix, rules = rules)
+
+    if cache is None:
+        return compare_data(_load_json_file(jsonFileA),
+                _load_json_file(jsonFileB), diffFilePrefix, rules)
+
+    return _compare_json_files(_get_canonicalizer(rules),
+            jsonFileA, jsonFileB, diffFilePrefix, cache)[0]
+
+
+# Canonicalizer and cache of a batch worker process.
+_WORKER_CANONICALIZER = None
+_WORKER_CACHE = None
+
+
+def _init_batch_worker(rules=None, cache=None):
+    """
+    Initialize a batch worker process.
+    """
+    global _WORKER_CANONICALIZER
+    global _WORKER_CACHE
+    _WORKER_CANONICALIZER = DataCanonicalizer(rules)
+    _WORKER_CACHE = cache
+
+
+def _compare_json_pair(task):
+    """
+    note   : Compare one pair of json files in a batch worker.
+    param  :
+        task    : (jsonFileA, jsonFileB, diffFilePrefix)
+    return : Result dict of the pair.
+    """
+    jsonFileA, jsonFileB, diffFilePrefix = task
+    result = {
+            "fileA": jsonFileA,
+            "fileB": jsonFileB,
+            "equal": False,
+            "digestA": None,
+            "digestB": None,
+            "diffFiles": [],
+            "elapsed": 0.0,
+            "error": None,
+            }
+
+    start = time.perf_counter()
+    try:
+        equal, digestA, digestB = _compare_json_files(
+                _WORKER_CANONICALIZER or _CANONICALIZER,
+                jsonFileA, jsonFileB, diffFilePrefix, _WORKER_CACHE, True)
+        result["equal"] = equal
+        result["digestA"] = digestA.hex()
+        result["digestB"] = digestB.hex()
+        if not equal:
+            result["diffFiles"] = [
+                    "{}_1.data".format(diffFilePrefix),
+                    "{}_2.data".format(diffFilePrefix),
+                    ]
+    except Exception as e:
+        result["error"] = str(e)
+    result["elapsed"] = time.perf_counter() - start
+
+    return result
+
+
+def compare_data_json_batch(filePairs, workers=None, diffDir=".", chunkSize=1,
+        rules=None, cache=None):
+    """
+    note   : Compare many pairs of json files across a process pool.
+    param  :
+        filePairs   : Iterable of (jsonFileA, jsonFileB).
+        workers     : Count of worker processes, cpu count by default.
+                      1 compares in current process.
+        diffDir     : Directory of diff files, "diff_<index>__[12].data".
+        chunkSize   : Pairs sent to a worker at a time.
+        rules       : Optional CompareRules.
+        cache       : Optional CanonicalCache of golden files.
+    return : List of result dicts in input order, with keys "fileA", "fileB",
+             "equal", "digestA", "digestB", "diffFiles", "elapsed", "error".
+             "error" is the message of a failure, such as a file that could
+             not be decoded, and "equal" is False then.
+    """
+    tasks = [(a, b, os.path.join(diffDir, "diff_{}_".format(i)))
+            for i, (a, b) in enumerate(filePairs)]
 
-    return compare_data(dictA, dictB, "diff_")
+    if workers == 1 or len(tasks) <= 1:
+        _init_batch_worker(rules, cache)
+        return [_compare_json_pair(task) for task in tasks]
 
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers = workers,
+            initializer = _init_batch_worker,
+            initargs = (rules, cache)) as executor:
+        return list(executor.map(_compare_json_pair, tasks,
+                chunksize = chunkSize))
@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the diff module.
+
+Usage:
+    python diff_benchmark.py --sizes 1K,1M,100M --output result.json
+    python diff_benchmark.py --sizes 1M --baseline result.json
+
+Every case runs in a fresh process, so its peak RSS is not polluted by
+former cases.
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import diff
+
+_SIZE_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+# Seconds of a case before its process is killed.
+_CASE_TIMEOUT = 600
+# Seconds between checks of a case process.
+_POLL_INTERVAL = 1
+
+
+def parse_size(sizeStr):
+    """
+    Parse size string like "10K", "5M" or "1G" to bytes.
+    """
+    sizeStr = sizeStr.strip().upper()
+    if sizeStr and sizeStr[-1] in _SIZE_UNITS:
+        return int(float(sizeStr[:-1]) * _SIZE_UNITS[sizeStr[-1]])
+    return int(sizeStr)
+
+
+def _random_word(rnd, chars, length):
+    return "".join(rnd.choice(chars) for _ in range(length))
+
+
+def generate_wide_dict(size, seed=0):
+    """
+    A flat dict with many short members.
+    """
+    rnd = random.Random(seed)
+    result = {}
+    count = max(1, size // 32)
+    for i in range(count):
+        result["key_{}".format(i)] = rnd.choice(
+                [rnd.randint(0, 1 << 30), rnd.random(), _random_word(
+                        rnd, "abcdefghij", 8)])
+    return result
+
+
+def generate_deep_nesting(size, seed=0, depth=64):
+    """
+    Chains of nested dicts and lists, "depth" levels each.
+    """
+    rnd = random.Random(seed)
+    result = []
+    count = max(1, size // (depth * 24))
+    for _ in range(count):
+        node = rnd.randint(0, 1 << 30)
+        for level in range(depth):
+            if level % 2:
+                node = [node, rnd.randint(0, 100)]
+            else:
+                node = {"v": node, "n": level}
+        result.append(node)
+    return result
+
+
+def generate_list_of_dicts(size, seed=0):
+    """
+    A long list of small records, in random order.
+    """
+    rnd = random.Random(seed)
+    count = max(1, size // 64)
+    result = [{"id": i, "name": _random_word(rnd, "abcdefghij", 6),
+            "score": rnd.random(), "tags": [rnd.randint(0, 9)
+                    for _ in range(rnd.randint(0, 3))]}
+            for i in range(count)]
+    rnd.shuffle(result)
+    return result
+
+
+def generate_unicode_strings(size, seed=0):
+    """
+    Records of long strings with non-ascii chars.
+    """
+    rnd = random.Random(seed)
+    chars = "abcéü中文日本ру\U0001f600"
+    count = max(1, size // 256)
+    return [{"text": _random_word(rnd, chars, 64),
+            "lang": rnd.choice(["zh", "ja", "ru", "fr"])}
+            for _ in range(count)]
+
+
+GENERATORS = {
+    "wide_dict": generate_wide_dict,
+    "deep_nesting": generate_deep_nesting,
+    "list_of_dicts": generate_list_of_dicts,
+    "unicode_strings": generate_unicode_strings,
+}
+
+
+def _shuffled_copy(inputData, seed):
+    """
+    Return a copy with lists shuffled, which compares equal to inputData.
+    """
+    rnd = random.Random(seed)
+    def walk(node):
+        if isinstance(node, list):
+            node = [walk(e) for e in node]
+            rnd.shuffle(node)
+            return node
+        if isinstance(node, dict):
+            return {k: walk(v) for k, v in node.items()}
+        return node
+    return walk(inputData)
+
+
+def _modified_copy(inputData, seed):
+    """
+    Return a shuffled copy with one leaf changed.
+    """
+    result = _shuffled_copy(inputData, seed)
+    node = result
+    while True:
+        if isinstance(node, list) and node and \
+                isinstance(node[0], (list, dict)):
+            node = node[0]
+        elif isinstance(node, dict) and node:
+            key = sorted(node)[0]
+            if isinstance(node[key], (list, dict)) and node[key]:
+                node = node[key]
+            else:
+                node[key] = "__modified__"
+                return result
+        elif isinstance(node, list) and node:
+            node[0] = "__modified__"
+            return result
+        else:
+            return result
+
+
+def _target_compare_data(dataA, dataB, workDir):
+    return diff.compare_data(dataA, dataB, os.path.join(workDir, "bench_"))
+
+
+def _target_sort_list(dataA, dataB, workDir):
+    return diff._sort_list_in_data(dataA)
+
+
+def _target_show_dict_diff(dataA, dataB, workDir):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return diff.show_dict_diff(dataA, dataB)
+
+
+def _target_data_diff(dataA, dataB, workDir):
+    return diff.get_data_diff(dataA, dataB)
+
+
+TARGETS = {
+    "compare_data_equal": (_target_compare_data, _shuffled_copy),
+    "compare_data_unequal": (_target_compare_data, _modified_copy),
+    "sort_list": (_target_sort_list, _shuffled_copy),
+    "show_dict_diff": (_target_show_dict_diff, _modified_copy),
+    "get_data_diff": (_target_data_diff, _modified_copy),
+}
+
+
+def _peak_rss_bytes():
+    """
+    Return peak RSS of current process.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere.
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+def measure(func, args, repeat, traceTop=0):
+    """
+    note   : Time func(*args) and measure its memory, in a case process.
+    param  :
+        func        : Function of a target.
+        args        : Arguments of func.
+        repeat      : Timed runs, the best one is reported.
+        traceTop    : Count of top allocation lines reported.
+    return : Dict of timings and memory usage.
+    """
+    rssBefore = _peak_rss_bytes()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    rssPeak = _peak_rss_bytes()
+
+    # Allocations are measured in a separate run, tracing is slow.
+    blocksBefore = sys.getallocatedblocks()
+    tracemalloc.start()
+    result = func(*args)
+    allocCurrent, allocPeak = tracemalloc.get_traced_memory()
+    allocTop = None
+    if traceTop:
+        snapshot = tracemalloc.take_snapshot()
+        allocTop = [str(stat) for stat in
+                snapshot.statistics("lineno")[:traceTop]]
+    tracemalloc.stop()
+    allocatedBlocks = sys.getallocatedblocks() - blocksBefore
+    del result
+
+    return {
+            "repeat": repeat,
+            "seconds": min(timings),
+            "secondsMedian": statistics.median(timings),
+            "peakRssBytes": rssPeak,
+            "peakRssDeltaBytes": rssPeak - rssBefore,
+            "allocPeakBytes": allocPeak,
+            "allocatedBlocks": allocatedBlocks,
+            "allocTop": allocTop,
+            }
+
+
+def _run_case(shape, target, size, repeat, seed, workDir, queue):
+    """
+    Run one case in a worker process and put its result to queue.
+    """
+    try:
+        dataA = GENERATORS[shape](size, seed)
+        func, makeB = TARGETS[target]
+        dataB = makeB(dataA, seed + 1)
+        inputBytes = len(json.dumps(dataA, ensure_ascii=False).encode("utf-8"))
+
+        result = {"shape": shape, "target": target, "size": size,
+                "inputBytes": inputBytes}
+        result.update(measure(func, (dataA, dataB, workDir), repeat))
+        best = result["seconds"]
+        result["throughputMBps"] = inputBytes / best / (1 << 20) if best else None
+        result["error"] = None
+        queue.put(result)
+    except Exception as e:
+        queue.put({"shape": shape, "target": target, "size": size,
+                "error": "{}: {}".format(type(e).__name__, e)})
+
+
+def run_in_process(target, args, case, timeout=_CASE_TIMEOUT):
+    """
+    note   : Run target in a fresh process and wait for the result it puts
+             to the queue passed as its last argument.
+    param  :
+        target  : Function of a case.
+        args    : Arguments of target, without the queue.
+        case    : Dict identifying the case, returned with "error" if the
+                  process exits or times out without a result.
+        timeout : Seconds before the process is killed, None for no limit.
+    return : Result dict of the case.
+    """
+    resultQueue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target = target,
+            args = tuple(args) + (resultQueue,))
+    proc.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    result = None
+    error = None
+    while result is None and error is None:
+        try:
+            result = resultQueue.get(timeout = _POLL_INTERVAL)
+        except queue.Empty:
+            if proc.exitcode is not None:
+                # The result may be put right before exiting.
+                try:
+                    result = resultQueue.get(timeout = _POLL_INTERVAL)
+                except queue.Empty:
+                    error = "Process exited with code {}.".format(
+                            proc.exitcode)
+            elif deadline is not None and time.monotonic() >= deadline:
+                proc.kill()
+                error = "Timeout after {} seconds.".format(timeout)
+    proc.join()
+
+    if result is None:
+        result = dict(case, error = error)
+    return result
+
+
+@contextlib.contextmanager
+def work_dir(workDir=None, prefix="benchmark_"):
+    """
+    Yield workDir, or a temporary directory removed at the end if None.
+    """
+    if workDir is not None:
+        yield workDir
+        return
+
+    tempDir = tempfile.mkdtemp(prefix = prefix)
+    try:
+        yield tempDir
+    finally:
+        shutil.rmtree(tempDir, ignore_errors = True)
+
+
+def run_cases(runCase, shapes, targets, sizes, args, timeout=_CASE_TIMEOUT,
+        formatResult=None):
+    """
+    note   : Run every (shape, target, size) case in a fresh process.
+    param  :
+        runCase         : Function of a case process, called with shape,
+                          target, size, args and the result queue.
+        shapes          : Names of input shapes.
+        targets         : Names of targets.
+        sizes           : Approximate input sizes in bytes.
+        args            : Other arguments of runCase.
+        timeout         : Seconds of a case before it is reported as failed.
+        formatResult    : Function formatting a result as a progress line.
+    return : List of case results.
+    """
+    results = []
+    for size in sizes:
+        for shape in shapes:
+            for target in targets:
+                result = run_in_process(runCase,
+                        (shape, target, size) + tuple(args),
+                        {"shape": shape, "target": target, "size": size},
+                        timeout)
+                results.append(result)
+                if formatResult is not None:
+                    print(formatResult(result), file = sys.stderr)
+    return results
+
+
+def run_benchmarks(shapes, targets, sizes, repeat=3, seed=0, workDir=None,
+        timeout=_CASE_TIMEOUT):
+    """
+    note   : Run every (shape, target, size) case in a fresh process.
+    param  :
+        shapes  : Names in GENERATORS.
+        targets : Names in TARGETS.
+        sizes   : Approximate input sizes in bytes.
+        repeat  : Timed runs per case, the best one is reported.
+        seed    : Seed of data generators.
+        workDir : Directory of diff files written by targets, a temporary
+                  directory removed at the end if None.
+        timeout : Seconds of a case before it is reported as failed.
+    return : List of case results.
+    """
+    with work_dir(workDir, "diff_benchmark_") as caseDir:
+        return run_cases(_run_case, shapes, targets, sizes,
+                (repeat, seed, caseDir), timeout, _format_result)
+
+
+def _format_result(result):
+    """
+    Format one case result as a line.
+    """
+    if result.get("error"):
+        return "{shape:16} {target:22} {size:>12} ERROR {error}".format(**result)
+    return ("{shape:16} {target:22} {size:>12} {seconds:10.4f}s "
+            "{throughputMBps:9.2f}MB/s rss={peakRssBytes} "
+            "alloc={allocPeakBytes}").format(**result)
+
+
+def _get_git_commit():
+    """
+    Return commit of the working tree, None if unavailable.
+    """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                cwd = os.path.dirname(os.path.abspath(__file__)),
+                stderr = subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare_with_baseline(results, baseline, threshold=0.1):
+    """
+    note   : Compare results with a former run.
+    param  :
+        results     : Case results of this run.
+        baseline    : Case results of a former run.
+        threshold   : Relative slowdown reported as regression.
+    return : List of (case, baselineSeconds, seconds, ratio, regressed).
+    """
+    former = {}
+    for r in baseline:
+        if not r.get("error"):
+            former[(r["shape"], r["target"], r["size"])] = r["seconds"]
+
+    report = []
+    for r in results:
+        case = (r["shape"], r["target"], r["size"])
+        if r.get("error") or case not in former or not former[case]:
+            continue
+        ratio = r["seconds"] / former[case]
+        report.append((case, former[case], r["seconds"], ratio,
+                ratio > 1 + threshold))
+    return report
+
+
+def add_arguments(parser, shapes, targets):
+    """
+    Add arguments shared by benchmarks to parser.
+    """
+    parser.add_argument("--shapes", default = ",".join(shapes))
+    parser.add_argument("--targets", default = ",".join(targets))
+    parser.add_argument("--sizes", default = "1K,100K,10M",
+            help = "Comma separated sizes, e.g. 1K,1M,1G.")
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--output", help = "Write results to json file.")
+    parser.add_argument("--baseline", help = "Json file of a former run.")
+    parser.add_argument("--threshold", type = float, default = 0.1,
+            help = "Relative slowdown reported as regression.")
+    parser.add_argument("--work-dir",
+            help = "Directory of files written by targets, a temporary one "
+                    "by default.")
+    parser.add_argument("--timeout", type = float, default = _CASE_TIMEOUT,
+            help = "Seconds of a case before it is reported as failed.")
+
+
+def report(results, args, width=50):
+    """
+    note   : Write results to args.output and compare them with
+             args.baseline.
+    param  :
+        results : Case results.
+        args    : Parsed arguments of add_arguments.
+        width   : Width of case names in the comparison.
+    return : Exit code, 1 if any case regressed.
+    """
+    output = {
+            "commit": _get_git_commit(),
+            "python": sys.version,
+            "platform": platform.platform(),
+            "time": datetime.datetime.now().isoformat(),
+            "results": results,
+            }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent = 4)
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        for case, before, after, ratio, slower in compare_with_baseline(
+                results, baseline, args.threshold):
+            regressed = regressed or slower
+            print("{:{}} {:10.4f}s -> {:10.4f}s x{:.2f}{}".format(
+                    " ".join(map(str, case)), width, before, after, ratio,
+                    " REGRESSION" if slower else ""))
+
+    return 1 if regressed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = "Benchmark diff module.")
+    add_arguments(parser, GENERATORS, TARGETS)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+            args.shapes.split(","),
+            args.targets.split(","),
+            [parse_size(s) for s in args.sizes.split(",")],
+            repeat = args.repeat,
+            seed = args.seed,
+            workDir = args.work_dir,
+            timeout = args.timeout)
+    return report(results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,344 @@
 # -*- coding: utf-8 -*-
 
+import collections
+import concurrent.futures
+import email.utils
+import gzip
+import hashlib
+import json
 import os
 import requests
+import threading
 import time
+import urllib.parse
+import zlib
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 from json_api import json_load
 from file_api import is_file_existing
 from utils import Logger
 
-def download_file_by_url(url, saveAs):
+# Configure of the shared session, see configure_http_session.
+_SESSION_CONF = {
+    "poolConnections": 10,
+    "poolMaxsize": 10,
+    "retries": 3,
+    "backoffFactor": 0.3,
+    "statusForcelist": (502, 503, 504),
+    "keepAlive": True,
+}
+_SESSION = None
+_SESSION_PID = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _create_http_session(conf):
+    """
+    Create a session with pooled connections and retries.
+    """
+    session = requests.Session()
+    retry = Retry(
+            total = conf["retries"],
+            backoff_factor = conf["backoffFactor"],
+            status_forcelist = conf["statusForcelist"],
+            raise_on_status = False)
+    adapter = HTTPAdapter(
+            pool_connections = conf["poolConnections"],
+            pool_maxsize = conf["poolMaxsize"],
+            max_retries = retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not conf["keepAlive"]:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def configure_http_session(**kwargs):
+    """
+    note   : Configure the session shared by HttpClient instances and
+             download_file_by_url. The session is rebuilt on next use.
+    param  :
+        poolConnections : Count of hosts whose connections are pooled.
+        poolMaxsize     : Count of connections kept per host.
+        retries         : Retries on connection errors and statusForcelist.
+        backoffFactor   : Sleep backoffFactor * 2 ** (retry - 1) between retries.
+        statusForcelist : Response status codes to retry.
+        keepAlive       : Keep connections alive between requests.
+    return : True if configured.
+    """
+    global _SESSION
+    unknown = set(kwargs) - set(_SESSION_CONF)
+    if unknown:
+        Logger.error("Unknown http session configure: {}".format(
+                ", ".join(sorted(unknown))))
+        return False
+
+    with _SESSION_LOCK:
+        _SESSION_CONF.update(kwargs)
+        if _SESSION is not None:
+            _SESSION.close()
+            _SESSION = None
+    return True
+
+
+def get_http_session():
+    """
+    Return the shared session, created on first use.
+    A forked process gets a new session, pooled sockets are not shared.
+    """
+    global _SESSION, _SESSION_PID
+    pid = os.getpid()
+    session = _SESSION
+    if session is not None and _SESSION_PID == pid:
+        return session
+
+    with _SESSION_LOCK:
+        if _SESSION is None or _SESSION_PID != pid:
+            _SESSION = _create_http_session(_SESSION_CONF)
+            _SESSION_PID = pid
+        return _SESSION
+
+
+# Downloads are written to saveAs + _PART_SUFFIX and renamed when complete.
+# Progress of segmented downloads is kept in saveAs + _STATE_SUFFIX.
+_DOWNLOAD_CHUNK_SIZE = 1 << 20
+_PART_SUFFIX = ".part"
+_STATE_SUFFIX = ".part.json"
+
+
+class _OrderedHasher():
+    """
+    Hash of a file written by segments in parallel.
+    Bytes are hashed as they are written when they follow the hashed prefix.
+    Bytes written ahead of it are read back once the prefix reaches them,
+    which is soon after, from page cache.
+    """
+    def __init__(self, hasher, fd, segments):
+        """
+        Initialization.
+        "segments" is a list of [start, written end, end], shared with the
+        writers.
+        """
+        self._hasher = hasher
+        self._fd = fd
+        self._segments = segments
+        self._pos = 0
+        self._lock = threading.Lock()
+
+    def update(self, segment, offset, data):
+        """
+        Record data written at offset of segment.
+        """
+        with self._lock:
+            segment[1] = offset + len(data)
+            if offset == self._pos:
+                self._hasher.update(data)
+                self._pos += len(data)
+            self._catch_up()
+
+    def _catch_up(self):
+        for start, written, end in self._segments:
+            if start <= self._pos < written:
+                while self._pos < written:
+                    data = os.pread(self._fd,
+                            min(written - self._pos, _DOWNLOAD_CHUNK_SIZE),
+                            self._pos)
+                    self._hasher.update(data)
+                    self._pos += len(data)
+
+    def finish(self):
+        with self._lock:
+            self._catch_up()
+
+
+def _hash_file(hasher, fileName, size=None):
+    """
+    Feed first size bytes of fileName to hasher.
+    """
+    with open(fileName, "rb") as f:
+        while size is None or size > 0:
+            data = f.read(_DOWNLOAD_CHUNK_SIZE if size is None
+                    else min(size, _DOWNLOAD_CHUNK_SIZE))
+            if not data:
+                break
+            hasher.update(data)
+            if size is not None:
+                size -= len(data)
+
+
+def _probe_download(session, url):
+    """
+    Return (size, whether ranges are accepted) of url, size is None if
+    unknown.
+    """
+    resp = session.head(url, allow_redirects = True)
+    if resp.status_code >= 400:
+        return None, False
+    size = resp.headers.get("Content-Length")
+    acceptRanges = resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+    return (int(size) if size is not None else None), acceptRanges
+
+
+def _download_stream(session, url, partFile, chunkSize, resume, hasher):
+    """
+    Download url to partFile by chunks, from the end of partFile if resume.
+    """
+    offset = 0
+    if resume and os.path.exists(partFile):
+        offset = os.path.getsize(partFile)
+
+    headers = {"Range": "bytes={}-".format(offset)} if offset else None
+    with session.get(url, headers = headers, stream = True) as resp:
+        if offset and resp.status_code == 416:
+            # partFile is already complete.
+            resp.close()
+            if hasher is not None:
+                _hash_file(hasher, partFile)
+            return
+        resp.raise_for_status()
+        if offset and resp.status_code != 206:
+            Logger.debug("Range is ignored by server, download from start.")
+            offset = 0
+        if hasher is not None and offset:
+            _hash_file(hasher, partFile, offset)
+
+        with open(partFile, "ab" if offset else "wb") as f:
+            for chunk in resp.iter_content(chunkSize):
+                f.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+
+
+def _load_segments(stateFile, url, size, count, resume):
+    """
+    Return segments [start, written end, end] of a segmented download,
+    restored from stateFile if resume.
+    """
+    if resume and is_file_existing(stateFile):
+        state = json_load(stateFile)
+        if state and state.get("url") == url and state.get("size") == size:
+            return state["segments"]
+
+    step = -(-size // count)
+    return [[start, start, min(start + step, size)]
+            for start in range(0, size, step)]
+
+
+def _save_segments(stateFile, url, size, segments):
+    with open(stateFile, "w") as f:
+        json.dump({"url": url, "size": size, "segments": segments}, f)
+
+
+def _download_segment(session, url, fd, segment, chunkSize, orderedHasher):
+    """
+    Download the rest of segment and write it in place.
+    """
+    start, written, end = segment
+    if written >= end:
+        return
+
+    headers = {"Range": "bytes={}-{}".format(written, end - 1)}
+    with session.get(url, headers = headers, stream = True) as resp:
+        if resp.status_code != 206:
+            raise IOError("Range of {} is not served, status {}.".format(
+                    url, resp.status_code))
+        for chunk in resp.iter_content(chunkSize):
+            chunk = chunk[:end - written]
+            os.pwrite(fd, chunk, written)
+            if orderedHasher is not None:
+                orderedHasher.update(segment, written, chunk)
+            else:
+                segment[1] = written + len(chunk)
+            written += len(chunk)
+            if written >= end:
+                break
+
+    if written < end:
+        raise IOError("Segment {}-{} of {} is truncated.".format(
+                start, end, url))
+
+
+def _download_segments(session, url, partFile, size, count, chunkSize,
+        resume, hasher):
+    """
+    Download url to partFile by count ranged segments in parallel.
+    """
+    stateFile = partFile[:-len(_PART_SUFFIX)] + _STATE_SUFFIX
+    if not os.path.exists(partFile):
+        resume = False
+    segments = _load_segments(stateFile, url, size, count, resume)
+
+    fd = os.open(partFile, os.O_RDWR | os.O_CREAT)
+    try:
+        os.ftruncate(fd, size)
+        orderedHasher = None
+        if hasher is not None:
+            orderedHasher = _OrderedHasher(hasher, fd, segments)
+
+        with concurrent.futures.ThreadPoolExecutor(len(segments)) as executor:
+            futures = [executor.submit(_download_segment, session, url, fd,
+                    segment, chunkSize, orderedHasher) for segment in segments]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                concurrent.futures.wait(futures)
+                _save_segments(stateFile, url, size, segments)
+                raise
+
+        if orderedHasher is not None:
+            orderedHasher.finish()
+    finally:
+        os.close(fd)
+
+    if os.path.exists(stateFile):
+        os.remove(stateFile)
+
+
+def download_file_by_url(url, saveAs, chunkSize=_DOWNLOAD_CHUNK_SIZE,
+        resume=False, segments=1, checksum=None, hashName="sha256"):
     """
-    Download file by url.
+    note   : Download file by url, writing it by chunks.
+    param  :
+        url         : Url of file.
+        saveAs      : Path to save file.
+        chunkSize   : Bytes read from response at a time.
+        resume      : Continue an interrupted download of saveAs.
+        segments    : Count of ranged requests in parallel, used when the
+                      server accepts ranges and tells the size.
+        checksum    : Expected hex digest of file, None to skip checking.
+        hashName    : Hash algorithm of checksum, in hashlib.
+    return : True if downloaded.
     """
     Logger.debug("Url to download: {}".format(url))
+    partFile = saveAs + _PART_SUFFIX
+    hasher = hashlib.new(hashName) if checksum else None
     try:
-        resp = requests.get(url)
-        with open(saveAs, "wb") as f:
-             f.write(resp.content)
+        session = get_http_session()
+        size = None
+        acceptRanges = False
+        if segments > 1:
+            size, acceptRanges = _probe_download(session, url)
+
+        if size and acceptRanges and segments > 1:
+            _download_segments(session, url, partFile, size, segments,
+                    chunkSize, resume, hasher)
+        else:
+            _download_stream(session, url, partFile, chunkSize, resume, hasher)
+
+        if hasher is not None and hasher.hexdigest() != checksum.lower():
+            Logger.error("Checksum of {} mismatched: {} != {}".format(
+                    url, hasher.hexdigest(), checksum))
+            os.remove(partFile)
+            return False
+        os.replace(partFile, saveAs)
     except Exception as e:
         Logger.error("Error orrcured while downloading file:")
         Logger.error(str(e))
@@ -25,14 +347,415 @@ def download_file_by_url(url, saveAs):
     return True
 
 
+class HttpResponseCache():
+    """
+    Cache of GET responses, keyed by method, url and selected headers.
+    Entries live in a bounded in-memory LRU tier, and optionally in an
+    on-disk tier evicted least recently used first, as a json file of
+    metadata and a file of the raw body per entry. Cache-Control max-age,
+    no-cache, no-store and Expires decide freshness. Stale entries with
+    ETag or Last-Modified are revalidated by conditional requests.
+    """
+    def __init__(self, maxEntries=1024, maxBytes=64 << 20, cacheDir=None,
+            maxDiskBytes=1 << 30, varyHeaders=(), defaultTtl=0):
+        """
+        Initialization.
+        param  :
+            maxEntries      : Count limit of entries in memory.
+            maxBytes        : Size limit of response bodies in memory.
+            cacheDir        : Directory of on-disk tier, None to disable it.
+            maxDiskBytes    : Size limit of entries on disk.
+            varyHeaders     : Names of request headers in the cache key.
+            defaultTtl      : Seconds a response without Cache-Control or
+                              Expires is fresh.
+        """
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.cacheDir = os.path.abspath(cacheDir) if cacheDir else None
+        self.maxDiskBytes = maxDiskBytes
+        self.varyHeaders = tuple(name.lower() for name in varyHeaders)
+        self.defaultTtl = defaultTtl
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if self.cacheDir:
+            os.makedirs(self.cacheDir, exist_ok = True)
+
+    @property
+    def stats(self):
+        """
+        Return counters of cache.
+        """
+        with self._lock:
+            return {
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "revalidations": self.revalidations,
+                    "evictions": self.evictions,
+                    "entries": len(self._entries),
+                    "bytes": self._bytes,
+                    }
+
+    def _get_key(self, method, url, headers):
+        """
+        Return key of request.
+        """
+        headers = dict((k.lower(), v) for k, v in (headers or {}).items())
+        vary = [(name, headers.get(name)) for name in self.varyHeaders]
+        return hashlib.sha256(json.dumps([method, url, vary]).encode(
+                "utf-8")).hexdigest()
+
+    def _get_expires(self, headers, now):
+        """
+        Return time until which a response is fresh, None if not storable.
+        """
+        cacheControl = {}
+        for directive in headers.get("Cache-Control", "").split(","):
+            name, _, value = directive.strip().partition("=")
+            cacheControl[name.lower()] = value.strip("\" ")
+
+        if "no-store" in cacheControl:
+            return None
+        if "no-cache" in cacheControl:
+            return now
+
+        age = 0
+        try:
+            age = int(headers.get("Age", 0))
+        except ValueError:
+            pass
+
+        if "max-age" in cacheControl:
+            try:
+                return now + int(cacheControl["max-age"]) - age
+            except ValueError:
+                return now
+        if "Expires" in headers:
+            try:
+                return email.utils.parsedate_to_datetime(
+                        headers["Expires"]).timestamp()
+            except (TypeError, ValueError):
+                return now
+        return now + self.defaultTtl
+
+    def _lookup(self, key):
+        """
+        Return entry of key from memory, then from disk.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if not self.cacheDir:
+            return None
+        metaFile, bodyFile = self._get_entry_files(key)
+        try:
+            with open(metaFile, "r", encoding = "utf-8") as f:
+                entry = json.load(f)
+            with open(bodyFile, "rb") as f:
+                entry["content"] = f.read()
+            # Mark as recently used.
+            os.utime(metaFile)
+        except (OSError, ValueError):
+            return None
+        # Body of another write of the same key.
+        if len(entry["content"]) != entry.pop("contentBytes", None):
+            return None
+
+        self._store_memory(key, entry)
+        return entry
+
+    def _get_entry_files(self, key):
+        """
+        Return (metadata file, body file) of key on disk.
+        """
+        entryFile = os.path.join(self.cacheDir, key)
+        return entryFile + ".json", entryFile + ".body"
+
+    def _store_memory(self, key, entry):
+        size = len(entry["content"])
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old["content"])
+            if size > self.maxBytes:
+                return
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.maxEntries or \
+                    self._bytes > self.maxBytes:
+                _, old = self._entries.popitem(last = False)
+                self._bytes -= len(old["content"])
+                self.evictions += 1
+
+    def _store(self, key, entry):
+        """
+        Store entry in memory and on disk.
+        """
+        self._store_memory(key, entry)
+        if not self.cacheDir:
+            return
+
+        metaFile, bodyFile = self._get_entry_files(key)
+        suffix = ".{}.{}.tmp".format(os.getpid(), threading.get_ident())
+        meta = dict(entry, contentBytes = len(entry["content"]))
+        del meta["content"]
+        # Metadata is written last, entries are found by it.
+        with open(bodyFile + suffix, "wb") as f:
+            f.write(entry["content"])
+        os.replace(bodyFile + suffix, bodyFile)
+        with open(metaFile + suffix, "w", encoding = "utf-8") as f:
+            json.dump(meta, f)
+        os.replace(metaFile + suffix, metaFile)
+        self._evict_disk()
+
+    def _remove(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old["content"])
+        if self.cacheDir:
+            for entryFile in self._get_entry_files(key):
+                try:
+                    os.remove(entryFile)
+                except OSError:
+                    pass
+
+    def _evict_disk(self):
+        """
+        Remove least recently used entries on disk beyond maxDiskBytes.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.cacheDir):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            try:
+                stat = os.stat(os.path.join(self.cacheDir, name))
+                size = stat.st_size + os.path.getsize(
+                        self._get_entry_files(key)[1])
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, size, key))
+            total += size
+
+        entries.sort()
+        for mtime, size, key in entries:
+            if total <= self.maxDiskBytes:
+                break
+            removed = False
+            for entryFile in self._get_entry_files(key):
+                try:
+                    os.remove(entryFile)
+                    removed = True
+                except OSError:
+                    pass
+            if removed:
+                with self._lock:
+                    self.evictions += 1
+            total -= size
+
+    @staticmethod
+    def _to_response(entry):
+        """
+        Build a requests response of entry.
+        """
+        resp = requests.Response()
+        resp.status_code = entry["status"]
+        resp.reason = entry["reason"]
+        resp.url = entry["url"]
+        resp.headers = requests.structures.CaseInsensitiveDict(entry["headers"])
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        resp._content = entry["content"]
+        return resp
+
+    def fetch(self, session, url, headers=None):
+        """
+        note   : Return response of GET url, from cache if it is fresh.
+        param  :
+            session : requests session to launch requests with.
+            url     : Url to get.
+            headers : Request headers.
+        return : requests response.
+        """
+        key = self._get_key("GET", url, headers)
+        entry = self._lookup(key)
+        if entry is not None and entry["expires"] > time.time():
+            with self._lock:
+                self.hits += 1
+            return self._to_response(entry)
+
+        reqHeaders = dict(headers or {})
+        if entry is not None:
+            if entry["headers"].get("ETag"):
+                reqHeaders["If-None-Match"] = entry["headers"]["ETag"]
+            if entry["headers"].get("Last-Modified"):
+                reqHeaders["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+
+        resp = session.get(url, headers = reqHeaders)
+        now = time.time()
+        if entry is not None and resp.status_code == 304:
+            with self._lock:
+                self.revalidations += 1
+            entry = dict(entry)
+            entry["headers"] = dict(entry["headers"])
+            entry["headers"].update(resp.headers)
+            expires = self._get_expires(
+                    requests.structures.CaseInsensitiveDict(entry["headers"]),
+                    now)
+            if expires is None:
+                self._remove(key)
+            else:
+                entry["expires"] = expires
+                self._store(key, entry)
+            return self._to_response(entry)
+
+        with self._lock:
+            self.misses += 1
+        expires = None
+        if resp.status_code == 200:
+            expires = self._get_expires(resp.headers, now)
+            # Stale at once and can not be revalidated.
+            if expires is not None and expires <= now and not (
+                    resp.headers.get("ETag") or
+                    resp.headers.get("Last-Modified")):
+                expires = None
+        if expires is None:
+            if entry is not None:
+                self._remove(key)
+            return resp
+
+        self._store(key, {
+                "status": resp.status_code,
+                "reason": resp.reason,
+                "url": resp.url,
+                "headers": dict(resp.headers),
+                "content": resp.content,
+                "expires": expires,
+                })
+        return resp
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.cacheDir:
+            for name in os.listdir(self.cacheDir):
+                if name.endswith(".json") or name.endswith(".body"):
+                    os.remove(os.path.join(self.cacheDir, name))
+
+
+# Request bodies are read and compressed by chunks of _BODY_CHUNK_SIZE.
+_BODY_CHUNK_SIZE = 1 << 16
+_COMPRESSIONS = ("gzip", "zstd")
+
+
+def _iter_body(data, chunkSize=_BODY_CHUNK_SIZE):
+    """
+    Yield bytes of a request body, which is bytes, str, a file-like object
+    or an iterable of bytes or str.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        yield bytes(data)
+    elif isinstance(data, str):
+        yield data.encode("utf-8")
+    elif hasattr(data, "read"):
+        for chunk in iter(lambda: data.read(chunkSize), b""):
+            if not chunk:
+                break
+            yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+    else:
+        for chunk in data:
+            yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+
+def _iter_compressed(chunks, compressor, flush):
+    for chunk in chunks:
+        compressed = compressor(chunk)
+        if compressed:
+            yield compressed
+    yield flush()
+
+
+def compress_body(data, compression, level=None):
+    """
+    note   : Compress a request body.
+    param  :
+        data        : Bytes, str, file-like object or iterable of chunks.
+        compression : "gzip" or "zstd", zstd needs the zstandard package.
+        level       : Compression level, default of the codec if None.
+    return : Compressed bytes for bytes or str, otherwise a generator which
+             reads and compresses data by chunks, sent as chunked upload.
+    """
+    if compression == "gzip":
+        if level is None:
+            level = 6
+        if isinstance(data, (bytes, bytearray, memoryview, str)):
+            return gzip.compress(b"".join(_iter_body(data)), level)
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return _iter_compressed(_iter_body(data), compressor.compress,
+                compressor.flush)
+
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package.")
+        cctx = zstandard.ZstdCompressor(level = 3 if level is None else level)
+        if isinstance(data, (bytes, bytearray, memoryview, str)):
+            return cctx.compress(b"".join(_iter_body(data)))
+        compressor = cctx.compressobj()
+        return _iter_compressed(_iter_body(data), compressor.compress,
+                compressor.flush)
+
+    raise ValueError("Unknown compression: {}".format(compression))
+
+
+def _override_url(url, spec):
+    """
+    Return url with "host", "port" and "path" of spec applied to it.
+    Query of url is dropped with its path.
+    """
+    if not spec.keys() & {"host", "port", "path"}:
+        return url
+
+    parts = urllib.parse.urlsplit(url)
+    host = spec.get("host", parts.hostname) or ""
+    if ":" in host:
+        host = "[{}]".format(host)
+    port = spec.get("port", parts.port)
+    netloc = host if port is None else "{}:{}".format(host, port)
+    userInfo = parts.netloc.rpartition("@")[0]
+    if userInfo:
+        netloc = "{}@{}".format(userInfo, netloc)
+    parts = parts._replace(netloc = netloc)
+    if "path" in spec:
+        parts = parts._replace(path = "/" + (spec["path"] or "").lstrip("/"),
+                query = "", fragment = "")
+    return urllib.parse.urlunsplit(parts)
+
+
 class HttpClient():
     """
     A handler of http client to launch requests.
     """
     def __init__(self, doPost=True, headers={}, url=None, 
-            host=None, port=None, path=None, data=None, name="httpClient"):
+            host=None, port=None, path=None, data=None, name="httpClient",
+            session=None, cache=None, compression=None):
         """
         Initialization.
+        "session" is the requests session to use, the shared pooled session
+        of get_http_session by default.
+        "cache" is an optional HttpResponseCache of GET requests.
+        "compression" of post data is "gzip", "zstd" or None.
         """
         self.__doPost = doPost
         self.__headers = headers
@@ -40,9 +763,13 @@ class HttpClient():
         self.__host = host
         self.__port = port
         self.__path = path
-        self.__reponse = None
+        self.__response = None
         self.__data = data
         self.__name = name
+        self.__session = session
+        self.__cache = cache
+        self.__compression = None
+        self.compression = compression
         # TODO
         # add parameters
         # urlencoding
@@ -191,6 +918,74 @@ class HttpClient():
         self.__name = value
         return True
 
+    @property
+    def session(self):
+        """
+        Return session.
+        """
+        if self.__session is None:
+            return get_http_session()
+        return self.__session
+
+    @session.setter
+    def session(self, value):
+        """
+        Set session, None for the shared session.
+        """
+        self.__session = value
+        return True
+
+    @property
+    def cache(self):
+        """
+        Return cache.
+        """
+        return self.__cache
+
+    @cache.setter
+    def cache(self, value):
+        """
+        Set cache, None to disable it.
+        """
+        if value is not None and not isinstance(value, HttpResponseCache):
+            Logger.error("Set cache of http client failed.")
+            return False
+
+        self.__cache = value
+        return True
+
+    @property
+    def compression(self):
+        """
+        Return compression of post data.
+        """
+        return self.__compression
+
+    @compression.setter
+    def compression(self, value):
+        """
+        Set compression of post data, "gzip", "zstd" or None.
+        """
+        if value is not None and value not in _COMPRESSIONS:
+            Logger.error("Set compression of http client failed.")
+            return False
+        if value == "zstd" and zstandard is None:
+            Logger.error("Compression zstd needs the zstandard package.")
+            return False
+
+        self.__compression = value
+        return True
+
+    @property
+    def requestUrl(self):
+        """
+        Return url to launch request to, built from host, port and path
+        if url is not set.
+        """
+        if self.url:
+            return self.url
+        return "http://{}:{}/{}".format(self.host, self.port, self.path)
+
     @property
     def response(self):
         """
@@ -231,22 +1026,47 @@ class HttpClient():
 
         return self.__response.content
 
-    def launch_request(self, waitTime=0):
+    def iter_respData(self, chunkSize=_BODY_CHUNK_SIZE):
         """
-        Lauch request.
+        Yield response data by chunks, decoded by Content-Encoding.
+        The body is read from network as chunks are consumed if request
+        was launched with stream.
+        """
+        if self.__response is None:
+            Logger.error("Launch request first.")
+            return
+
+        yield from self.__response.iter_content(chunkSize)
+
+    def launch_request(self, waitTime=0, stream=False, callback=None,
+            chunkSize=_BODY_CHUNK_SIZE):
+        """
+        note   : Lauch request.
+                 Post data may be bytes, str, a file-like object or an
+                 iterable of chunks, which are uploaded by chunks.
+        param  :
+            waitTime    : Seconds to sleep after request.
+            stream      : Do not read response body, which is consumed by
+                          iter_respData.
+            callback    : Called with every chunk of response body, which is
+                          not kept in memory. Implies stream.
+            chunkSize   : Bytes of response chunks.
         """
         self.__response = None
 
-        url = self.url
-        if not url:
-            url = "http://{}:{}/{}".format(self.host, self.port, self.path)
+        url = self.requestUrl
+        session = self.session
 
         Logger.debug("Launch request to: {}".format(url))
-        if self.doPost:
-            self.__response = requests.post(url, headers = self.headers, 
-                    data = self.data)
-        else:
-            self.__response = requests.get(url, headers = self.headers)
+        self.__response = self._send(session, self.doPost, url, self.headers,
+                self.data, stream or callback is not None)
+
+        if callback is not None:
+            try:
+                for chunk in self.__response.iter_content(chunkSize):
+                    callback(chunk)
+            finally:
+                self.__response.close()
 
         if waitTime:
             time.sleep(waitTime)
@@ -254,6 +1074,83 @@ class HttpClient():
         # TODO
         # catch exception and set return
 
+    def _send(self, session, doPost, url, headers, data, stream=False):
+        """
+        Send a request, GET requests go through cache if any.
+        """
+        if doPost:
+            # Dicts, lists and tuples are form data, sent as they are.
+            if self.compression is not None and data is not None and \
+                    not isinstance(data, (dict, list, tuple)):
+                data = compress_body(data, self.compression)
+                headers = dict(headers or {})
+                headers["Content-Encoding"] = self.compression
+            elif isinstance(data, memoryview):
+                data = data.tobytes()
+            elif data is not None and not isinstance(
+                    data, (bytes, bytearray, str, dict, list, tuple)) and \
+                    not hasattr(data, "read"):
+                # Iterables of str are uploaded as bytes.
+                data = _iter_body(data)
+            return session.post(url, headers = headers, data = data,
+                    stream = stream)
+        if self.cache is not None and not stream:
+            return self.cache.fetch(session, url, headers)
+        return session.get(url, headers = headers, stream = stream)
+
+    def _launch_spec(self, session, spec):
+        """
+        Launch request of spec over the configure of client.
+        """
+        result = {"status": None, "body": None, "elapsed": None, "error": None}
+        start = time.perf_counter()
+        try:
+            url = spec.get("url")
+            if not url and self.url:
+                url = _override_url(self.url, spec)
+            elif not url:
+                url = "http://{}:{}/{}".format(
+                        spec.get("host", self.host),
+                        spec.get("port", self.port),
+                        (spec.get("path", self.path) or "").lstrip("/"))
+
+            headers = self.headers
+            if spec.get("headers"):
+                headers = dict(headers, **spec["headers"])
+
+            resp = self._send(session, spec.get("doPost", self.doPost), url,
+                    headers, spec.get("data", self.data))
+            result["status"] = resp.status_code
+            result["body"] = resp.content
+        except Exception as e:
+            result["error"] = "{}: {}".format(type(e).__name__, e)
+        result["elapsed"] = time.perf_counter() - start
+        return result
+
+    def launch_requests(self, specs, workers=10):
+        """
+        note   : Launch a batch of requests over a thread pool, without
+                 changing the client.
+        param  :
+            specs   : List of dicts overriding configure of the client, with
+                      keys of "url", "host", "port", "path", "headers"
+                      (merged to client headers), "data" and "doPost".
+                      "host", "port" and "path" apply to url of the client
+                      if it is set.
+            workers : Count of threads. The shared session pools
+                      poolMaxsize connections per host, see
+                      configure_http_session.
+        return : List of dicts of "status", "body", "elapsed" and "error",
+                 in order of specs.
+        """
+        session = self.session
+        if workers <= 1:
+            return [self._launch_spec(session, spec) for spec in specs]
+
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            return list(executor.map(
+                    lambda spec: self._launch_spec(session, spec), specs))
+
     def reset(self):
         """
         Reset internal vars.
@@ -264,7 +1161,7 @@ class HttpClient():
         self.__host = None
         self.__port = None
         self.__path = None
-        self.__reponse = None
+        self.__response = None
         self.__data = None
 
     def load_conf_file(self, confFile):
@@ -298,5 +1195,11 @@ class HttpClient():
         if "path" in confData:
             self.path = confData["path"]
 
+        if "doPost" in confData:
+            self.doPost = confData["doPost"]
+
+        if "data" in confData:
+            self.data = confData["data"]
+
         return True
 
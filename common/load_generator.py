@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+"""
+Load generator of http requests.
+
+Usage:
+    python load_generator.py req.json --duration 60 --rate 1000
+    python load_generator.py a.json b.json --duration 60 --concurrency 200 \
+            --output report.json
+
+Request configs are in the format of HttpClient.load_conf_file. Requests of
+every config are launched by an AsyncHttpClient, the rate or concurrency is
+split evenly between configs.
+
+With a rate, latencies are counted from the scheduled start of requests, so
+a slow server is not hidden by requests started late (coordinated omission),
+and "serviceTime" reports the time from actual start.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import sys
+import time
+
+from async_http_client import AsyncHttpClient
+from json_api import json_load
+
+# Seconds of a request before it is an error.
+_DEFAULT_TIMEOUT = 30
+
+
+class LatencyHistogram():
+    """
+    HDR-style histogram of latencies.
+    Values are counted in log-linear buckets of microseconds, each power of
+    two split into 2 ** subBucketBits buckets, so the relative error of a
+    recorded value is below 2 ** (1 - subBucketBits).
+    """
+    def __init__(self, subBucketBits=11):
+        """
+        Initialization.
+        """
+        self._subBucketBits = subBucketBits
+        self._counts = collections.Counter()
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._sum = 0.0
+
+    def _index(self, micros):
+        shift = max(0, micros.bit_length() - self._subBucketBits)
+        return (shift << self._subBucketBits) + (micros >> shift)
+
+    def _highest_value(self, index):
+        """
+        Return highest microseconds counted in bucket of index.
+        """
+        shift = index >> self._subBucketBits
+        sub = index & ((1 << self._subBucketBits) - 1)
+        return ((sub + 1) << shift) - 1
+
+    def record(self, seconds):
+        """
+        Record a latency in seconds.
+        """
+        micros = max(0, int(seconds * 1e6))
+        self._counts[self._index(micros)] += 1
+        self.count += 1
+        self._sum += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        """
+        Add counts of other histogram of the same precision.
+        """
+        self._counts.update(other._counts)
+        self.count += other.count
+        self._sum += other._sum
+        for value in (other.min, other.max):
+            if value is None:
+                continue
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        """
+        Return latency in seconds at percent (0 - 100), None if empty.
+        """
+        if not self.count:
+            return None
+
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= rank:
+                return min(self._highest_value(index) / 1e6, self.max)
+        return self.max
+
+    def mean(self):
+        return self._sum / self.count if self.count else None
+
+    def to_dict(self):
+        """
+        Return summary of latencies in seconds.
+        """
+        return {
+                "count": self.count,
+                "min": self.min,
+                "mean": self.mean(),
+                "p50": self.percentile(50),
+                "p90": self.percentile(90),
+                "p99": self.percentile(99),
+                "p999": self.percentile(99.9),
+                "max": self.max,
+                }
+
+
+def _split(total, parts):
+    """
+    Split total to parts which differ by at most 1, or evenly for floats.
+    """
+    if isinstance(total, float):
+        return [total / parts] * parts
+    return [total // parts + (1 if i < total % parts else 0)
+            for i in range(parts)]
+
+
+class _LoadStats():
+    """
+    Counters of a load run.
+    """
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.serviceHistogram = LatencyHistogram()
+        self.requests = 0
+        self.errors = 0
+        self.statusCodes = collections.Counter()
+        self.errorTypes = collections.Counter()
+
+    def add(self, result):
+        self.requests += 1
+        self.histogram.record(result["latency"])
+        self.serviceHistogram.record(result["elapsed"])
+        if result["error"]:
+            self.errors += 1
+            self.errorTypes[result["error"].split(":")[0]] += 1
+            return
+        self.statusCodes[str(result["status"])] += 1
+        if result["status"] >= 400:
+            self.errors += 1
+
+
+async def _run_client(client, stats, deadline, count, rate):
+    """
+    Launch requests of client until deadline or count.
+    Requests in flight at deadline are counted as timed out.
+    """
+    async with client:
+        async for result in client.iter_requests(count = count, rate = rate,
+                deadline = deadline):
+            stats.add(result)
+
+
+async def _run_load(clients, duration, rates, counts):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration if duration else None
+    stats = [_LoadStats() for _ in clients]
+    await asyncio.gather(*[
+            _run_client(client, stat, deadline, count, rate)
+            for client, stat, count, rate in zip(clients, stats, counts, rates)])
+    return stats
+
+
+def run_load(confs, duration=None, rate=None, concurrency=10, count=None,
+        timeout=_DEFAULT_TIMEOUT):
+    """
+    note   : Launch requests of confs at a target rate or concurrency.
+    param  :
+        confs       : List of request configures, as dicts or json files in
+                      the format of HttpClient.load_conf_file.
+        duration    : Seconds to run, None to run until count.
+        rate        : Total requests per second, None for no limit.
+        concurrency : Total requests in flight at most.
+        count       : Total requests to launch, None to run until duration.
+        timeout     : Seconds of a request before it is an error, None for
+                      no limit.
+    return : Report dict, latencies are in seconds.
+    """
+    if duration is None and count is None:
+        raise ValueError("Either duration or count is required.")
+
+    clients = []
+    concurrencies = _split(concurrency, len(confs))
+    for conf, clientConcurrency in zip(confs, concurrencies):
+        if isinstance(conf, str):
+            conf = json_load(conf)
+        client = AsyncHttpClient(concurrency = max(1, clientConcurrency),
+                timeout = timeout)
+        if not client.load_conf_data(conf):
+            raise ValueError("Invalid request configure: {}".format(conf))
+        clients.append(client)
+
+    rates = [None] * len(clients)
+    if rate:
+        rates = _split(float(rate), len(clients))
+    counts = [None] * len(clients)
+    if count is not None:
+        counts = _split(count, len(clients))
+    elif rate:
+        # Stop scheduling requests at the end of duration.
+        counts = [int(r * duration) + 1 for r in rates]
+
+    start = time.perf_counter()
+    stats = asyncio.run(_run_load(clients, duration, rates, counts))
+    elapsed = time.perf_counter() - start
+
+    total = _LoadStats()
+    for stat in stats:
+        total.histogram.merge(stat.histogram)
+        total.serviceHistogram.merge(stat.serviceHistogram)
+        total.requests += stat.requests
+        total.errors += stat.errors
+        total.statusCodes.update(stat.statusCodes)
+        total.errorTypes.update(stat.errorTypes)
+
+    report = {
+            "elapsed": elapsed,
+            "requests": total.requests,
+            "errors": total.errors,
+            "throughput": total.requests / elapsed if elapsed else None,
+            "statusCodes": dict(total.statusCodes),
+            "errorTypes": dict(total.errorTypes),
+            "latency": total.histogram.to_dict(),
+            "targets": [{
+                    "url": client.requestUrl,
+                    "requests": stat.requests,
+                    "errors": stat.errors,
+                    "latency": stat.histogram.to_dict(),
+                    } for client, stat in zip(clients, stats)],
+            }
+    if rate:
+        report["rate"] = {"target": rate, "achieved": report["throughput"]}
+        report["serviceTime"] = total.serviceHistogram.to_dict()
+        for target, stat in zip(report["targets"], stats):
+            target["serviceTime"] = stat.serviceHistogram.to_dict()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = "Generate http load.")
+    parser.add_argument("confs", nargs = "+",
+            help = "Request configure files of HttpClient.")
+    parser.add_argument("--duration", type = float, help = "Seconds to run.")
+    parser.add_argument("--count", type = int, help = "Requests to launch.")
+    parser.add_argument("--rate", type = float,
+            help = "Requests per second, no limit by default.")
+    parser.add_argument("--concurrency", type = int, default = 10)
+    parser.add_argument("--timeout", type = float, default = _DEFAULT_TIMEOUT,
+            help = "Seconds of a request before it is an error.")
+    parser.add_argument("--output", help = "Write report to json file.")
+    args = parser.parse_args(argv)
+
+    if args.duration is None and args.count is None:
+        parser.error("Either --duration or --count is required.")
+
+    report = run_load(args.confs, args.duration, args.rate, args.concurrency,
+            args.count, args.timeout)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 4)
+    print(json.dumps(report, indent = 4))
+    return 0 if not report["errors"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the py_pb_convert module.
+
+Usage:
+    python pb_benchmark.py --sizes 1K,1M,10M --output result.json
+    python pb_benchmark.py --sizes 1M --baseline result.json
+    python pb_benchmark.py --sizes 1M --profile prof_dir --trace-top 10
+
+Schemas are in pb_benchmark.proto, compiled by protoc, or by grpc_tools when
+protoc is not installed. Every case runs in a fresh process, like
+diff_benchmark.py.
+"""
+
+import argparse
+import cProfile
+import importlib
+import os
+import pstats
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from google.protobuf import text_format
+
+from diff_benchmark import _CASE_TIMEOUT
+from diff_benchmark import add_arguments
+from diff_benchmark import measure
+from diff_benchmark import parse_size
+from diff_benchmark import report
+from diff_benchmark import run_cases
+from diff_benchmark import work_dir
+import py_pb_convert
+
+_PROTO_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "pb_benchmark.proto")
+_PROTO_MODULE = "pb_benchmark_pb2"
+
+
+def compile_proto(protoFile, outDir):
+    """
+    Compile protoFile to python module in outDir, with protoc or grpc_tools.
+    """
+    protoDir, protoName = os.path.split(os.path.abspath(protoFile))
+    args = ["-I", protoDir, "--python_out", outDir, protoName]
+    protoc = shutil.which("protoc")
+    if protoc:
+        command = [protoc] + args
+    else:
+        try:
+            importlib.import_module("grpc_tools.protoc")
+        except ImportError:
+            raise RuntimeError("Neither protoc nor grpc_tools is installed.")
+        command = [sys.executable, "-m", "grpc_tools.protoc"] + args
+    subprocess.check_call(command)
+
+
+def _load_schema(schemaDir):
+    """
+    Import compiled schema module from schemaDir.
+    """
+    if schemaDir not in sys.path:
+        sys.path.insert(0, schemaDir)
+    return importlib.import_module(_PROTO_MODULE)
+
+
+def _random_word(rnd, chars, length):
+    return "".join(rnd.choice(chars) for _ in range(length))
+
+
+def _generate_flat_one(rnd):
+    return {
+        "i32": rnd.randint(-(1 << 31), (1 << 31) - 1),
+        "i64": rnd.randint(-(1 << 63), (1 << 63) - 1),
+        "u32": rnd.randint(0, (1 << 32) - 1),
+        "d": rnd.random(),
+        "f": 0.5,
+        "b": rnd.random() < 0.5,
+        "s": _random_word(rnd, "abcdefghij", 12),
+        "by": _random_word(rnd, "0123456789", 8),
+        "kind": rnd.randint(0, 2),
+        "text": _random_word(rnd, "abcé中文ру", 8),
+        "s64": rnd.randint(-1000, 1000),
+        "fx32": rnd.randint(0, 1 << 20),
+        }
+
+
+def generate_flat(size, seed=0):
+    """
+    Many small messages of scalar fields.
+    """
+    rnd = random.Random(seed)
+    return [_generate_flat_one(rnd) for _ in range(max(1, size // 96))]
+
+
+def generate_nested(size, seed=0, depth=32):
+    """
+    Messages of sub-messages "depth" levels deep.
+    """
+    rnd = random.Random(seed)
+    result = []
+    for _ in range(max(1, size // (depth * 12))):
+        node = {"level": depth, "name": _random_word(rnd, "abcdefghij", 4)}
+        for level in range(depth - 1, -1, -1):
+            node = {"level": level, "name": _random_word(rnd, "abc", 4),
+                    "child": node}
+        result.append(node)
+    return result
+
+
+def generate_repeated_scalar(size, seed=0):
+    """
+    One message of long repeated scalar fields.
+    """
+    rnd = random.Random(seed)
+    count = max(1, size // 24)
+    return [{
+        "values": [rnd.randint(-(1 << 40), 1 << 40) for _ in range(count)],
+        "scores": [rnd.random() for _ in range(count)],
+        "tags": [_random_word(rnd, "abcdefghij", 6) for _ in range(count)],
+        }]
+
+
+def generate_repeated_message(size, seed=0):
+    """
+    One message of a long repeated message field.
+    """
+    rnd = random.Random(seed)
+    return [{"items": [_generate_flat_one(rnd)
+            for _ in range(max(1, size // 96))]}]
+
+
+# Shape name: (generator, message class name).
+GENERATORS = {
+    "flat": (generate_flat, "pb_benchmark.Flat"),
+    "nested": (generate_nested, "pb_benchmark.Nested"),
+    "repeated_scalar": (generate_repeated_scalar, "pb_benchmark.RepeatedScalar"),
+    "repeated_message": (generate_repeated_message,
+            "pb_benchmark.RepeatedMessage"),
+}
+
+
+class _Case():
+    """
+    Inputs of a case, prepared once and shared by targets.
+    """
+    def __init__(self, shape, size, seed, workDir):
+        generator, self.clsName = GENERATORS[shape]
+        self.pyDatas = generator(size, seed)
+        self.pbHandlers = [py_pb_convert.pyData_to_pbHandler(self.clsName, d)
+                for d in self.pyDatas]
+        self.pbStrings = [h.SerializeToString() for h in self.pbHandlers]
+        self.workDir = workDir
+        self.debugFile = os.path.join(workDir, "pb_benchmark_{}.txt".format(
+                os.getpid()))
+        self.jsonLinesFile = self.debugFile + ".jsonl"
+
+    def write_debugFile(self):
+        with open(self.debugFile, "w", encoding = "utf-8") as f:
+            for pbHandler in self.pbHandlers:
+                f.write(text_format.MessageToString(
+                        pbHandler, as_utf8 = True))
+                f.write("\n")
+        return os.path.getsize(self.debugFile)
+
+    def cleanup(self):
+        for fileName in (self.debugFile, self.jsonLinesFile):
+            if os.path.exists(fileName):
+                os.remove(fileName)
+
+
+def _target_pyData_to_pbHandler(case):
+    return [py_pb_convert.pyData_to_pbHandler(case.clsName, d)
+            for d in case.pyDatas]
+
+
+def _target_pbHandler_to_pyData(case):
+    return [py_pb_convert.pbHandler_to_pyData(h) for h in case.pbHandlers]
+
+
+def _target_pbString_to_pyData(case):
+    return [py_pb_convert.pbString_to_pyData(case.clsName, s)
+            for s in case.pbStrings]
+
+
+def _target_pbHandler_to_json(case):
+    return [py_pb_convert.pbHandler_to_json(h) for h in case.pbHandlers]
+
+
+def _target_pbDebugFile_to_pyData(case):
+    return [py_pb_convert.pbHandler_to_pyData(h) for h in
+            py_pb_convert.pbDebugFile_to_pbHandlers(case.clsName, case.debugFile)]
+
+
+def _target_pbDebugFile_to_jsonLines(case):
+    return py_pb_convert.pbDebugFile_to_jsonLines(
+            case.clsName, case.debugFile, case.jsonLinesFile)
+
+
+# Target name: (function, whether input is the text format debug file).
+TARGETS = {
+    "pyData_to_pbHandler": (_target_pyData_to_pbHandler, False),
+    "pbHandler_to_pyData": (_target_pbHandler_to_pyData, False),
+    "pbString_to_pyData": (_target_pbString_to_pyData, False),
+    "pbHandler_to_json": (_target_pbHandler_to_json, False),
+    "pbDebugFile_to_pyData": (_target_pbDebugFile_to_pyData, True),
+    "pbDebugFile_to_jsonLines": (_target_pbDebugFile_to_jsonLines, True),
+}
+
+
+def _profile_case(func, case, profileFile):
+    """
+    Run func once under cProfile, dump stats to profileFile.
+    """
+    profiler = cProfile.Profile()
+    profiler.runcall(func, case)
+    profiler.dump_stats(profileFile)
+    stats = pstats.Stats(profiler, stream = sys.stderr)
+    stats.sort_stats("cumulative").print_stats(10)
+
+
+def _run_case(shape, target, size, repeat, seed, schemaDir, workDir,
+        profileDir, traceTop, queue):
+    """
+    Run one case in a worker process and put its result to queue.
+    """
+    case = None
+    try:
+        _load_schema(schemaDir)
+        case = _Case(shape, size, seed, workDir)
+        func, isText = TARGETS[target]
+        if isText:
+            inputBytes = case.write_debugFile()
+        else:
+            inputBytes = sum(len(s) for s in case.pbStrings)
+        messages = len(case.pyDatas)
+
+        result = {"shape": shape, "target": target, "size": size,
+                "messages": messages, "inputBytes": inputBytes}
+        result.update(measure(func, (case,), repeat, traceTop))
+
+        profileFile = None
+        if profileDir:
+            profileFile = os.path.join(profileDir, "{}_{}_{}.prof".format(
+                    shape, target, size))
+            _profile_case(func, case, profileFile)
+
+        best = result["seconds"]
+        result["messagesPerSecond"] = messages / best if best else None
+        result["bytesPerSecond"] = inputBytes / best if best else None
+        result["profileFile"] = profileFile
+        result["error"] = None
+        queue.put(result)
+    except Exception as e:
+        queue.put({"shape": shape, "target": target, "size": size,
+                "error": "{}: {}".format(type(e).__name__, e)})
+    finally:
+        if case is not None:
+            case.cleanup()
+
+
+def run_benchmarks(shapes, targets, sizes, repeat=3, seed=0, workDir=None,
+        profileDir=None, traceTop=0, timeout=_CASE_TIMEOUT):
+    """
+    note   : Compile the schemas and run every (shape, target, size) case in
+             a fresh process.
+    param  :
+        shapes      : Names in GENERATORS.
+        targets     : Names in TARGETS.
+        sizes       : Approximate input sizes in bytes.
+        repeat      : Timed runs per case, the best one is reported.
+        seed        : Seed of data generators.
+        workDir     : Directory of files written by targets, a temporary
+                      directory removed at the end if None.
+        profileDir  : Directory of cProfile stats per case, None to skip.
+        traceTop    : Count of top allocation lines reported per case.
+        timeout     : Seconds of a case before it is reported as failed.
+    return : List of case results.
+    """
+    if profileDir and not os.path.isdir(profileDir):
+        os.makedirs(profileDir)
+
+    with tempfile.TemporaryDirectory() as schemaDir, \
+            work_dir(workDir, "pb_benchmark_") as caseDir:
+        compile_proto(_PROTO_FILE, schemaDir)
+        return run_cases(_run_case, shapes, targets, sizes,
+                (repeat, seed, schemaDir, caseDir, profileDir, traceTop),
+                timeout, _format_result)
+
+
+def _format_result(result):
+    """
+    Format one case result as a line.
+    """
+    if result.get("error"):
+        return "{shape:16} {target:24} {size:>12} ERROR {error}".format(**result)
+    return ("{shape:16} {target:24} {size:>12} {seconds:10.4f}s "
+            "{messagesPerSecond:12.1f}msg/s {bytesPerSecond:14.1f}B/s "
+            "rss={peakRssBytes} alloc={allocPeakBytes}").format(**result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = "Benchmark py_pb_convert.")
+    add_arguments(parser, GENERATORS, TARGETS)
+    parser.add_argument("--profile", help = "Directory of cProfile stats.")
+    parser.add_argument("--trace-top", type = int, default = 0,
+            help = "Report top allocation lines of every case.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+            args.shapes.split(","),
+            args.targets.split(","),
+            [parse_size(s) for s in args.sizes.split(",")],
+            repeat = args.repeat,
+            seed = args.seed,
+            workDir = args.work_dir,
+            profileDir = args.profile,
+            traceTop = args.trace_top,
+            timeout = args.timeout)
+    return report(results, args, 60)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk conversion between json lines files and pb record files.
+
+Usage:
+    python pb_pipeline.py json2pb --cls Message --input in.jsonl --output out.pbr
+    python pb_pipeline.py pb2json --cls Message --input in.pbr --output out.jsonl
+
+Input is read by chunks, converted across a process pool and written in
+input order. Every worker keeps its own cached class converters.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import sys
+import time
+
+from py_pb_convert import PbRecordWriter
+from py_pb_convert import pbHandler_to_json
+from py_pb_convert import pbRecordFile_to_pbStrings
+from py_pb_convert import pbString_to_pbHandler
+from py_pb_convert import pyData_to_pbString
+
+_CHUNK_SIZE = 1000
+
+
+def _jsonLines_to_pbStrings(task):
+    """
+    Convert a chunk of json lines to pbStrings.
+    """
+    clsName, lines, strict = task
+    return [pyData_to_pbString(clsName, json.loads(line), strict)
+            for line in lines if line.strip()]
+
+
+def _pbStrings_to_jsonLines(task):
+    """
+    Convert a chunk of pbStrings to json lines.
+    """
+    clsName, pbStrings, useEnumEabels = task
+    lines = []
+    for pbString in pbStrings:
+        pbHandler = pbString_to_pbHandler(clsName, pbString)
+        if pbHandler is None:
+            raise ValueError("Parse pbString of {} failed.".format(clsName))
+        lines.append(pbHandler_to_json(
+                pbHandler, useEnumEabels = useEnumEabels))
+        lines.append("\n")
+    return "".join(lines)
+
+
+def _iter_chunks(iterable, chunkSize):
+    """
+    Yield lists of chunkSize items.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunkSize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _run_ordered(func, tasks, workers):
+    """
+    note   : Yield func(task) in order of tasks, running across processes.
+             At most 2 * workers tasks are in flight, so input is read as
+             output is written.
+    param  :
+        func    : Picklable function.
+        tasks   : Iterable of tasks.
+        workers : Count of processes, 1 runs in current process.
+    """
+    if workers == 1:
+        for task in tasks:
+            yield func(task)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+        maxInFlight = 2 * workers
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(executor.submit(func, task))
+            if len(pending) >= maxInFlight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _get_stats(records, start):
+    """
+    Return stats of a conversion.
+    """
+    elapsed = time.perf_counter() - start
+    return {
+            "records": records,
+            "elapsed": elapsed,
+            "recordsPerSecond": records / elapsed if elapsed else None,
+            }
+
+
+def jsonLines_to_pbRecordFile(clsName, jsonLinesFile, pbFile, workers=None,
+        chunkSize=_CHUNK_SIZE, withIndex=False, strict=False):
+    """
+    note   : Convert a json lines file to a pb record file.
+    param  :
+        clsName         : Message class name.
+        jsonLinesFile   : Input file, one json object per line.
+        pbFile          : Output pb record file.
+        workers         : Count of processes, cpu count by default.
+        chunkSize       : Records sent to a worker at a time.
+        withIndex       : Write index footer to pbFile.
+        strict          : Validate every record before building it.
+    return : Dict of "records", "elapsed" and "recordsPerSecond".
+    """
+    start = time.perf_counter()
+    with open(jsonLinesFile, "r", encoding = "utf-8") as f, \
+            PbRecordWriter(pbFile, withIndex) as writer:
+        tasks = ((clsName, lines, strict) for lines in _iter_chunks(f, chunkSize))
+        for pbStrings in _run_ordered(_jsonLines_to_pbStrings, tasks, workers):
+            for pbString in pbStrings:
+                writer.write(pbString)
+
+    return _get_stats(writer.count, start)
+
+
+def pbRecordFile_to_jsonLines(clsName, pbFile, jsonLinesFile, workers=None,
+        chunkSize=_CHUNK_SIZE, useEnumEabels=False):
+    """
+    note   : Convert a pb record file to a json lines file.
+    param  :
+        clsName         : Message class name.
+        pbFile          : Input pb record file.
+        jsonLinesFile   : Output file, one json object per line.
+        workers         : Count of processes, cpu count by default.
+        chunkSize       : Records sent to a worker at a time.
+        useEnumEabels   : Write enum labels instead of numbers.
+    return : Dict of "records", "elapsed" and "recordsPerSecond".
+    """
+    start = time.perf_counter()
+    records = 0
+    with open(jsonLinesFile, "w", encoding = "utf-8") as f:
+        chunks = _iter_chunks(pbRecordFile_to_pbStrings(pbFile), chunkSize)
+        tasks = ((clsName, pbStrings, useEnumEabels) for pbStrings in chunks)
+        for lines in _run_ordered(_pbStrings_to_jsonLines, tasks, workers):
+            f.write(lines)
+            records += lines.count("\n")
+
+    return _get_stats(records, start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description = "Convert between json lines and pb record files.")
+    parser.add_argument("mode", choices = ["json2pb", "pb2json"])
+    parser.add_argument("--cls", required = True, help = "Message class name.")
+    parser.add_argument("--input", required = True)
+    parser.add_argument("--output", required = True)
+    parser.add_argument("--workers", type = int, default = None)
+    parser.add_argument("--chunk-size", type = int, default = _CHUNK_SIZE)
+    parser.add_argument("--index", action = "store_true",
+            help = "Write index footer to pb record file.")
+    parser.add_argument("--strict", action = "store_true")
+    parser.add_argument("--enum-labels", action = "store_true")
+    args = parser.parse_args(argv)
+
+    if args.mode == "json2pb":
+        stats = jsonLines_to_pbRecordFile(args.cls, args.input, args.output,
+                args.workers, args.chunk_size, args.index, args.strict)
+    else:
+        stats = pbRecordFile_to_jsonLines(args.cls, args.input, args.output,
+                args.workers, args.chunk_size, args.enum_labels)
+
+    print(json.dumps(stats), file = sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
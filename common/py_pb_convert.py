@@ -1,8 +1,17 @@
 # -*- coding: utf-8 -*-
 
+from google.protobuf import descriptor_pool
+from google.protobuf import message_factory
+from google.protobuf import symbol_database
 from google.protobuf import text_format
 from google.protobuf.descriptor import FieldDescriptor as FD
+from json.encoder import encode_basestring
+import collections
+import importlib
+import json
+import mmap
 import os
+import struct
 import sys
 
 from file_api import generate_temp_file
@@ -11,63 +20,482 @@ from file_api import remove_file
 from shell_api import get_env_var
 from json_api import pyData_to_json_file
 
-# Import pb2 classes before using.
+# pb2 modules under PB_FILES_ROOT are imported on first use, according to
+# the import statements in PB_IMPORTING (separated by "\\n").
 PB_FILES_ROOT = get_env_var("PB_FILES_ROOT")
+PB_IMPORTING = None
 if PB_FILES_ROOT:
     PB_FILES_ROOT = os.path.abspath(PB_FILES_ROOT)
     if PB_FILES_ROOT not in os.sys.path:
         os.sys.path.insert(0, PB_FILES_ROOT)
     PB_IMPORTING = get_env_var("PB_IMPORTING")
-    if PB_IMPORTING:
-        for i in PB_IMPORTING.split("\\n"):
-            exec(i)
 
-def _pyData_to_pbHandler(cls, pyData, strict=False):
+
+class PbClassRegistry():
     """
-    Convert pyData to pbHandler of cls.
-    "cls" here is "_concrete_class" but string.
+    Resolve message classes by name and cache them.
+    Names are looked up in the lazily imported PB_IMPORTING modules, then as
+    dotted module paths, then as full names in the protobuf descriptor pool.
     """
-    # Declare pbHandler according to cls.
-    pbHandler = cls()
+    def __init__(self, importing=None):
+        """
+        Initialization.
+        "importing" holds import statements separated by "\\n".
+        """
+        self._classes = {}
+        # Bound name: (module to import, attribute of it or None).
+        # "import a.b" binds "a" to ("a.b", "") and returns package "a".
+        self._names = {}
+        # Modules imported with "from module import *".
+        self._starModules = []
+        # Statements which could not be parsed, executed on demand.
+        self._statements = []
+        self._namespace = None
+
+        for statement in (importing or "").split("\\n"):
+            self._add_statement(statement.strip())
+
+    def _add_statement(self, statement):
+        """
+        Record an import statement without executing it.
+        """
+        if not statement:
+            return
+
+        words = statement.replace(",", " , ").split()
+        try:
+            if words[0] == "import":
+                for item in " ".join(words[1:]).split(","):
+                    parts = item.split()
+                    if len(parts) == 3 and parts[1] == "as":
+                        self._names[parts[2]] = (parts[0], None)
+                    elif len(parts) == 1:
+                        head = parts[0].split(".")[0]
+                        self._names.setdefault(head, (parts[0], ""))
+                    else:
+                        raise ValueError(statement)
+                return
+
+            if words[0] == "from" and words[2] == "import":
+                module = words[1]
+                if words[3:] == ["*"]:
+                    self._starModules.append(module)
+                    return
+                for item in " ".join(words[3:]).strip("() ").split(","):
+                    parts = item.split()
+                    if len(parts) == 3 and parts[1] == "as":
+                        self._names[parts[2]] = (module, parts[0])
+                    elif len(parts) == 1:
+                        self._names[parts[0]] = (module, parts[0])
+                    else:
+                        raise ValueError(statement)
+                return
+        except (IndexError, ValueError):
+            pass
+
+        self._statements.append(statement)
+
+    def _lookup_head(self, head):
+        """
+        Return the object bound to first component of a name.
+        """
+        if head in self._names:
+            module, attr = self._names[head]
+            obj = importlib.import_module(module)
+            if attr is None:
+                return obj
+            if not attr:
+                return sys.modules[head]
+            try:
+                return getattr(obj, attr)
+            except AttributeError:
+                # "from package import module" of a submodule not imported
+                # by the package itself.
+                return importlib.import_module(module + "." + attr)
+
+        for module in self._starModules:
+            obj = importlib.import_module(module)
+            if hasattr(obj, head):
+                return getattr(obj, head)
+
+        if self._statements:
+            if self._namespace is None:
+                self._namespace = {}
+                for statement in self._statements:
+                    exec(statement, self._namespace)
+            if head in self._namespace:
+                return self._namespace[head]
+
+        raise AttributeError(head)
+
+    def _resolve(self, clsName):
+        """
+        Resolve class of clsName, raise if not found.
+        """
+        parts = clsName.split(".")
+        try:
+            obj = self._lookup_head(parts[0])
+            for part in parts[1:]:
+                obj = getattr(obj, part)
+            return obj
+        except (AttributeError, ImportError):
+            pass
+
+        # "package.module_pb2.Message"
+        for i in range(len(parts) - 1, 0, -1):
+            try:
+                obj = importlib.import_module(".".join(parts[:i]))
+            except ImportError:
+                continue
+            try:
+                for part in parts[i:]:
+                    obj = getattr(obj, part)
+                return obj
+            except AttributeError:
+                break
 
-    for field in pbHandler.DESCRIPTOR.fields:
-        if field.label != field.LABEL_REQUIRED:
-            continue
-        if not field.has_default_value:
-            continue
-        if field.name not in pyData:
-            msg = "Field \"{}\" missing from descriptor dictionary.".format(field.name)
-            raise ConvertException(msg)
+        # Full name of message in proto, like "package.Message".
+        descriptor = descriptor_pool.Default().FindMessageTypeByName(clsName)
+        if hasattr(message_factory, "GetMessageClass"):
+            return message_factory.GetMessageClass(descriptor)
+        return symbol_database.Default().GetSymbol(clsName)
+
+    def get(self, clsName):
+        """
+        Return class of clsName, None if not found.
+        """
+        cls = self._classes.get(clsName)
+        if cls is not None:
+            return cls
+
+        if not isinstance(clsName, str):
+            return clsName
+
+        try:
+            cls = self._resolve(clsName)
+        except Exception:
+            return None
+
+        self._classes[clsName] = cls
+        return cls
+
+
+_PB_CLASS_REGISTRY = PbClassRegistry(PB_IMPORTING)
+
+
+def get_pb_class(clsName):
+    """
+    Return message class of clsName, None if not found.
+    "clsName" may also be the class itself.
+    """
+    return _PB_CLASS_REGISTRY.get(clsName)
+
+
+def __getattr__(name):
+    """
+    Expose classes of PB_IMPORTING as module attributes, as they were when
+    PB_IMPORTING was executed at import time.
+    """
+    if not name.startswith("__"):
+        cls = get_pb_class(name)
+        if cls is not None:
+            return cls
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
+
+
+class ConvertException(Exception):
+    """
+    Raised when pyData can not be converted to pbHandler.
+    "errors" holds (path, message) of every problem found.
+    """
+    def __init__(self, msg, errors=None):
+        super().__init__(msg)
+        self.errors = errors or []
 
-    field_names = set([field.name for field in pbHandler.DESCRIPTOR.fields])
-    if strict:
-        for key in pyData.keys():
-            if key not in field_names:
-                msg = "Key \"{}\" can not be mapped to field in {} class.".format\
-                        (key, type(pbHandler)) 
-                raise ConvertException(msg)
-
-    for field in pbHandler.DESCRIPTOR.fields:
-        if field.name not in pyData:
-            continue
 
-        msg_type = field.message_type
+# Kinds of field in pyData plans.
+_FILL_SCALAR = 0
+_FILL_BYTES = 1
+_FILL_MESSAGE = 2
+_FILL_REPEATED = 3
+_FILL_REPEATED_MESSAGE = 4
+
+# Compiled pyData plans by message descriptor.
+_PYDATA_PLANS = {}
+
+
+def _get_pyData_plan(descriptor):
+    """
+    Return the plan to fill messages of descriptor from pyData.
+    The plan is compiled once per descriptor as
+    (required field names, {field name: (fill kind, message descriptor)}).
+    """
+    plan = _PYDATA_PLANS.get(descriptor)
+    if plan is not None:
+        return plan
+
+    required = []
+    fields = {}
+    for field in descriptor.fields:
+        if field.label == FD.LABEL_REQUIRED and field.has_default_value:
+            required.append(field.name)
+
         if field.label == FD.LABEL_REPEATED:
             if field.type == FD.TYPE_MESSAGE:
-                for sub_py in pyData[field.name]:
-                    item = getattr(pbHandler, field.name).add()
-                    item.CopyFrom(_pyData_to_pbHandler(msg_type._concrete_class, sub_py))
+                kind = _FILL_REPEATED_MESSAGE
             else:
-                for sub_py in pyData[field.name]:
-                    getattr(pbHandler, field.name).append(sub_py)
+                kind = _FILL_REPEATED
+        elif field.type == FD.TYPE_MESSAGE:
+            kind = _FILL_MESSAGE
+        elif field.type == FD.TYPE_BYTES:
+            kind = _FILL_BYTES
         else:
-            if field.type == FD.TYPE_MESSAGE:
-                value = _pyData_to_pbHandler(msg_type._concrete_class, pyData[field.name])
-                getattr(pbHandler, field.name).CopyFrom(value)
-            elif field.type == FD.TYPE_BYTES:
-                setattr(pbHandler, field.name, pyData[field.name].encode('utf8'))
-            else:
-                setattr(pbHandler, field.name, pyData[field.name])
+            kind = _FILL_SCALAR
+        fields[field.name] = (kind, field.message_type)
+
+    plan = (tuple(required), fields)
+    _PYDATA_PLANS[descriptor] = plan
+    return plan
+
+
+def _fill_pbHandler(pbHandler, pyData, plan):
+    """
+    Fill pbHandler from pyData in place according to plan.
+    Sub-messages are filled through their parent, without copies.
+    Keys which are not fields are skipped, strict mode validates pyData
+    before filling.
+    """
+    required, fields = plan
+    for name in required:
+        if name not in pyData:
+            msg = "Field \"{}\" missing from descriptor dictionary.".format(name)
+            raise ConvertException(msg)
+
+    for key, value in pyData.items():
+        fieldPlan = fields.get(key)
+        if fieldPlan is None:
+            continue
+
+        kind, msgType = fieldPlan
+        if kind == _FILL_SCALAR:
+            setattr(pbHandler, key, value)
+        elif kind == _FILL_REPEATED_MESSAGE:
+            container = getattr(pbHandler, key)
+            subPlan = _get_pyData_plan(msgType)
+            for subPy in value:
+                _fill_pbHandler(container.add(), subPy, subPlan)
+        elif kind == _FILL_MESSAGE:
+            subHandler = getattr(pbHandler, key)
+            subHandler.SetInParent()
+            _fill_pbHandler(subHandler, value, _get_pyData_plan(msgType))
+        elif kind == _FILL_REPEATED:
+            getattr(pbHandler, key).extend(value)
+        else:
+            setattr(pbHandler, key, value.encode('utf8'))
+
+
+# Ranges of int fields, (min, max).
+_INT_RANGES = {
+    FD.TYPE_INT32: (-(1 << 31), (1 << 31) - 1),
+    FD.TYPE_SINT32: (-(1 << 31), (1 << 31) - 1),
+    FD.TYPE_SFIXED32: (-(1 << 31), (1 << 31) - 1),
+    FD.TYPE_INT64: (-(1 << 63), (1 << 63) - 1),
+    FD.TYPE_SINT64: (-(1 << 63), (1 << 63) - 1),
+    FD.TYPE_SFIXED64: (-(1 << 63), (1 << 63) - 1),
+    FD.TYPE_UINT32: (0, (1 << 32) - 1),
+    FD.TYPE_FIXED32: (0, (1 << 32) - 1),
+    FD.TYPE_UINT64: (0, (1 << 64) - 1),
+    FD.TYPE_FIXED64: (0, (1 << 64) - 1),
+}
+
+_VALIDATE_MAX_REPORTED = 10
+
+
+def _type_error(expected, value):
+    return "expect {}, got {}".format(expected, type(value).__name__)
+
+
+def _compile_value_checker(field):
+    """
+    Compile checker of a single field value, which returns an error
+    message or None. It accepts the values protobuf accepts.
+    """
+    if field.type in _INT_RANGES:
+        low, high = _INT_RANGES[field.type]
+        def check(value):
+            if not isinstance(value, int):
+                return _type_error("int", value)
+            if not low <= value <= high:
+                return "value {} out of range [{}, {}]".format(value, low, high)
+    elif field.type in (FD.TYPE_DOUBLE, FD.TYPE_FLOAT):
+        def check(value):
+            if isinstance(value, float):
+                return None
+            if not isinstance(value, int):
+                return _type_error("float", value)
+            try:
+                float(value)
+            except OverflowError:
+                return "value {} out of float range".format(value)
+    elif field.type == FD.TYPE_BOOL:
+        low, high = _INT_RANGES[FD.TYPE_INT64]
+        def check(value):
+            if not isinstance(value, int):
+                return _type_error("bool", value)
+            if not low <= value <= high:
+                return "value {} out of range [{}, {}]".format(value, low, high)
+    elif field.type == FD.TYPE_STRING:
+        def check(value):
+            if isinstance(value, bytes):
+                try:
+                    value.decode("utf-8")
+                except UnicodeDecodeError:
+                    return "bytes is not utf-8"
+            elif not isinstance(value, str):
+                return _type_error("str", value)
+    elif field.type == FD.TYPE_BYTES:
+        def check(value):
+            if not isinstance(value, str):
+                return _type_error("str", value)
+    elif field.type == FD.TYPE_ENUM:
+        enumType = field.enum_type
+        numbers = frozenset(v.number for v in enumType.values)
+        names = frozenset(v.name for v in enumType.values)
+        closed = getattr(enumType, "is_closed", True)
+        def check(value):
+            if isinstance(value, str):
+                if value not in names:
+                    return "unknown {} label \"{}\"".format(
+                            enumType.full_name, value)
+            elif not isinstance(value, int):
+                return _type_error("enum", value)
+            elif closed and value not in numbers:
+                return "unknown {} value {}".format(enumType.full_name, value)
+    else:
+        raise TypeError("Field {} has unrecognised type id {}".format(
+            field.full_name, field.type))
+    return check
+
+
+# Compiled pyData validators by message descriptor.
+_PYDATA_VALIDATORS = {}
+
+
+def _get_pyData_validator(descriptor):
+    """
+    Return the validator of pyData of descriptor, compiled once as
+    (required field names, {field name: (fill kind, checker, message descriptor)}).
+    """
+    validator = _PYDATA_VALIDATORS.get(descriptor)
+    if validator is not None:
+        return validator
+
+    required = []
+    fields = {}
+    _, kinds = _get_pyData_plan(descriptor)
+    for field in descriptor.fields:
+        if field.label == FD.LABEL_REQUIRED:
+            required.append(field.name)
+        kind, msgType = kinds[field.name]
+        check = None
+        if field.type != FD.TYPE_MESSAGE:
+            check = _compile_value_checker(field)
+        fields[field.name] = (kind, check, msgType)
+
+    validator = (tuple(required), fields)
+    _PYDATA_VALIDATORS[descriptor] = validator
+    return validator
+
+
+def _validate_pyData(pyData, descriptor, path, errors):
+    """
+    Append (path, message) of every problem in pyData to errors.
+    """
+    if not isinstance(pyData, dict):
+        errors.append((path, _type_error("dict", pyData)))
+        return
+
+    required, fields = _get_pyData_validator(descriptor)
+    for name in required:
+        if name not in pyData:
+            errors.append((path, "missing required field \"{}\"".format(name)))
+
+    for key, value in pyData.items():
+        fieldValidator = fields.get(key)
+        fieldPath = "{}.{}".format(path, key)
+        if fieldValidator is None:
+            errors.append((fieldPath, "unknown field of {}".format(
+                    descriptor.full_name)))
+            continue
+
+        kind, check, msgType = fieldValidator
+        if kind == _FILL_MESSAGE:
+            _validate_pyData(value, msgType, fieldPath, errors)
+        elif kind == _FILL_REPEATED or kind == _FILL_REPEATED_MESSAGE:
+            if not isinstance(value, (list, tuple)):
+                errors.append((fieldPath, _type_error("list", value)))
+                continue
+            for i, element in enumerate(value):
+                if kind == _FILL_REPEATED_MESSAGE:
+                    _validate_pyData(element, msgType,
+                            "{}[{}]".format(fieldPath, i), errors)
+                else:
+                    msg = check(element)
+                    if msg is not None:
+                        errors.append(("{}[{}]".format(fieldPath, i), msg))
+        else:
+            msg = check(value)
+            if msg is not None:
+                errors.append((fieldPath, msg))
+
+
+def _raise_pyData_errors(descriptor, errors):
+    """
+    Raise ConvertException of all errors.
+    """
+    msg = "{} error(s) in pyData of {}: {}".format(
+            len(errors), descriptor.full_name, "; ".join(
+                    "{}: {}".format(path, error)
+                    for path, error in errors[:_VALIDATE_MAX_REPORTED]))
+    if len(errors) > _VALIDATE_MAX_REPORTED:
+        msg += "; ..."
+    raise ConvertException(msg, errors)
+
+
+def validate_pyData(clsName, pyData):
+    """
+    note   : Check pyData against message class of clsName in one pass,
+             without building any message.
+    param  :
+        clsName : Message class name.
+        pyData  : Dict to check.
+    return : List of (path, message) of every problem, path like "$.a[1].b".
+             None if class is not found.
+    """
+    cls = get_pb_class(clsName)
+    if not cls:
+        return None
+
+    errors = []
+    _validate_pyData(pyData, cls.DESCRIPTOR, "$", errors)
+    return errors
+
+
+def _pyData_to_pbHandler(cls, pyData, strict=False):
+    """
+    Convert pyData to pbHandler of cls.
+    "cls" here is "_concrete_class" but string.
+    """
+    # Reject invalid pyData before building anything.
+    if strict:
+        errors = []
+        _validate_pyData(pyData, cls.DESCRIPTOR, "$", errors)
+        if errors:
+            _raise_pyData_errors(cls.DESCRIPTOR, errors)
+
+    # Declare pbHandler according to cls.
+    pbHandler = cls()
+    _fill_pbHandler(pbHandler, pyData, _get_pyData_plan(cls.DESCRIPTOR))
 
     return pbHandler
 
@@ -77,7 +505,7 @@ def pyData_to_pbHandler(clsName, pyData, strict=False):
     Convert pyData to pbHandler of clsName.
     "clsName" here is a string.
     """
-    cls = eval(clsName)
+    cls = get_pb_class(clsName)
     if not cls:
         return None
 
@@ -136,29 +564,22 @@ def pbFile_to_pbString(pbFile):
     Convert pbFile to pbStrings.
     """
     if not is_file_existing(pbFile):
-        return ""
+        return b""
 
-    pbString = ""
-    with open(pbFile, "r") as f:
-        while True:
-            lines = f.readlines(10000)
-            if not lines:
-                break
-            else:
-                for line in lines:
-                    pbString += line
-
-    if pbString:
-        pbString = pbString[:-1]
-    return pbString
+    with open(pbFile, "rb") as f:
+        return f.read()
 
 
 def pbString_to_pbHandler(clsName, pbString):
     """
     Convert pbString to pbHandler.
     """
+    cls = get_pb_class(clsName)
+    if not cls:
+        return None
+
     try:
-        pbHandler = eval(clsName + "()")
+        pbHandler = cls()
         pbHandler.ParseFromString(pbString)
 
         return pbHandler
@@ -200,33 +621,95 @@ def _repeated(type_callable):
     return lambda value_list: [type_callable(value) for value in value_list]
 
 
-def _enum_label_name(field, value):
-    return field.enum_type.values_by_number[int(value)].name
+# Compiled field converters of pbHandler_to_pyData, by
+# (descriptor, items of typeCallableMap, useEnumEabels), least recently used
+# first. Maps of equal items share converters.
+_PYDATA_CONVERTERS = collections.OrderedDict()
+_PYDATA_CONVERTERS_LIMIT = 1024
+_TYPE_CALLABLE_MAP_KEY = frozenset(_TYPE_CALLABLE_MAP.items())
 
 
-def _get_field_value_adaptor(
-        pbHandler, 
-        field, 
-        typeCallableMap=_TYPE_CALLABLE_MAP, 
+def _get_pyData_converters(descriptor, typeCallableMap, useEnumEabels):
+    """
+    Return the field converters of descriptor, {field: (key, converter)}.
+    Converters are compiled on the first time each field is met.
+    """
+    if typeCallableMap is _TYPE_CALLABLE_MAP:
+        mapKey = _TYPE_CALLABLE_MAP_KEY
+    else:
+        mapKey = frozenset(typeCallableMap.items())
+    key = (descriptor, mapKey, useEnumEabels)
+    converters = _PYDATA_CONVERTERS.get(key)
+    if converters is None:
+        converters = {}
+        _PYDATA_CONVERTERS[key] = converters
+        if len(_PYDATA_CONVERTERS) > _PYDATA_CONVERTERS_LIMIT:
+            _PYDATA_CONVERTERS.popitem(last = False)
+    else:
+        _PYDATA_CONVERTERS.move_to_end(key)
+
+    return converters
+
+
+def _compile_field_converter(
+        pbHandler,
+        field,
+        typeCallableMap=_TYPE_CALLABLE_MAP,
         useEnumEabels=False):
     """
-    Get value of field.
+    Compile the converter of field value.
+    Return (key, converter), key is None for extensions.
     """
     if field.type == FD.TYPE_MESSAGE:
         # recursively encode protobuf sub-message
-        return lambda pbHandler: pbHandler_to_pyData(
-                pbHandler,
-                typeCallableMap = typeCallableMap,
-                useEnumEabels = useEnumEabels)
+        subConverters = _get_pyData_converters(
+                field.message_type, typeCallableMap, useEnumEabels)
+        typeCallable = lambda subHandler: _pbHandler_to_pyData(
+                subHandler, subConverters, typeCallableMap, useEnumEabels)
+    elif useEnumEabels and field.type == FD.TYPE_ENUM:
+        labels = dict([(v.number, v.name) for v in field.enum_type.values])
+        typeCallable = lambda value: labels[int(value)]
+    elif field.type in typeCallableMap:
+        typeCallable = typeCallableMap[field.type]
+    else:
+        raise TypeError("Field {}.{} has unrecognised type id {}".format(
+            pbHandler.__class__.__name__, field.name, field.type))
+
+    if field.label == FD.LABEL_REPEATED:
+        typeCallable = _repeated(typeCallable)
+
+    if field.is_extension:
+        return None, typeCallable
+    return field.name, typeCallable
+
+
+def _pbHandler_to_pyData(pbHandler, converters, typeCallableMap, useEnumEabels):
+    """
+    Convert pbHandler to pyData with compiled converters.
+    """
+    resultDict = {}
+    extensions = {}
+    for field, value in pbHandler.ListFields():
+        converter = converters.get(field)
+        if converter is None:
+            converter = _compile_field_converter(
+                    pbHandler,
+                    field,
+                    typeCallableMap,
+                    useEnumEabels)
+            converters[field] = converter
+
+        key, typeCallable = converter
+        if key is None:
+            extensions[str(field.number)] = typeCallable(value)
+            continue
 
-    if useEnumEabels and field.type == FD.TYPE_ENUM:
-        return lambda value: _enum_label_name(field, value)
+        resultDict[key] = typeCallable(value)
 
-    if field.type in typeCallableMap:
-        return typeCallableMap[field.type]
+    if extensions:
+        resultDict[_EXTENSION_CONTAINER] = extensions
 
-    raise TypeError("Field {}.{} has unrecognised type id {}".format(
-        pbHandler.__class__.__name__, field.name, field.type))
+    return resultDict
 
 
 def pbHandler_to_pyData(
@@ -236,36 +719,278 @@ def pbHandler_to_pyData(
     """
     Convert pbHandler to pyData.
     """
-    resultDict = {}
-    extensions = {}
-    for field, value in pbHandler.ListFields():
-        typeCallable = _get_field_value_adaptor(
-                pbHandler, 
-                field, 
-                typeCallableMap, 
-                useEnumEabels)
+    converters = _get_pyData_converters(
+            pbHandler.DESCRIPTOR, typeCallableMap, useEnumEabels)
+    return _pbHandler_to_pyData(
+            pbHandler, converters, typeCallableMap, useEnumEabels)
+
+
+# Direct json serialization of pbHandler, giving the same text as
+# json.dumps(pbHandler_to_pyData(pbHandler), sort_keys = True,
+# ensure_ascii = False, indent = indent) without building pyData.
+# It only pays off for indented output, which json.dumps encodes in pure
+# python. Compact output is left to the C encoder of json.dumps.
+_JSON_FLUSH_PARTS = 1 << 13
+
+
+def _float_to_json(value):
+    if value != value:
+        return "NaN"
+    if value == float("inf"):
+        return "Infinity"
+    if value == -float("inf"):
+        return "-Infinity"
+    return float.__repr__(value)
+
+
+def _bool_to_json(value):
+    return "true" if value else "false"
+
+
+def _bytes_to_json(value):
+    return encode_basestring(str(value))
+
+
+_JSON_SCALAR_ENCODERS = {
+    FD.TYPE_DOUBLE: _float_to_json,
+    FD.TYPE_FLOAT: _float_to_json,
+    FD.TYPE_INT32: int.__repr__,
+    FD.TYPE_INT64: int.__repr__,
+    FD.TYPE_UINT32: int.__repr__,
+    FD.TYPE_UINT64: int.__repr__,
+    FD.TYPE_SINT32: int.__repr__,
+    FD.TYPE_SINT64: int.__repr__,
+    FD.TYPE_FIXED32: int.__repr__,
+    FD.TYPE_FIXED64: int.__repr__,
+    FD.TYPE_SFIXED32: int.__repr__,
+    FD.TYPE_SFIXED64: int.__repr__,
+    FD.TYPE_BOOL: _bool_to_json,
+    FD.TYPE_STRING: encode_basestring,
+    FD.TYPE_BYTES: _bytes_to_json,
+    FD.TYPE_ENUM: int.__repr__,
+}
+
+
+class _JsonParts(list):
+    """
+    Parts of json text, flushed to file when there are many of them.
+    """
+    __slots__ = ("file",)
+
+    def __init__(self, file=None):
+        super().__init__()
+        self.file = file
+
+    def flush(self):
+        if self.file is not None:
+            self.file.write("".join(self))
+            del self[:]
+
+
+# Compiled field writers of pbHandler_to_json, by (descriptor, useEnumEabels).
+_JSON_WRITERS = {}
+
 
+def _get_json_writers(descriptor, useEnumEabels):
+    """
+    Return the field writers of descriptor, {field: (key, writer)}.
+    Writers are compiled on the first time each field is met.
+    """
+    key = (descriptor, useEnumEabels)
+    writers = _JSON_WRITERS.get(key)
+    if writers is None:
+        writers = _JSON_WRITERS[key] = {}
+    return writers
+
+
+def _compile_field_writer(pbHandler, field, useEnumEabels):
+    """
+    Compile the writer of field value, writer(value, parts, newline, indent).
+    Return (key, writer), key is None for extensions.
+    """
+    if field.type == FD.TYPE_MESSAGE:
+        subWriters = _get_json_writers(field.message_type, useEnumEabels)
         if field.label == FD.LABEL_REPEATED:
-            typeCallable = _repeated(typeCallable)
+            def writer(value, parts, newline, indent):
+                if not value:
+                    parts.append("[]")
+                    return
+                inner = newline + indent
+                sep, close = "," + inner, newline + "]"
+                parts.append("[" + inner)
+                first = True
+                for subHandler in value:
+                    if not first:
+                        parts.append(sep)
+                    first = False
+                    _write_json_message(subHandler, subWriters, parts,
+                            inner, indent, useEnumEabels)
+                parts.append(close)
+        else:
+            def writer(value, parts, newline, indent):
+                _write_json_message(value, subWriters, parts,
+                        newline, indent, useEnumEabels)
+    else:
+        if useEnumEabels and field.type == FD.TYPE_ENUM:
+            labels = dict([(v.number, encode_basestring(v.name))
+                    for v in field.enum_type.values])
+            encoder = labels.__getitem__
+        elif field.type in _JSON_SCALAR_ENCODERS:
+            encoder = _JSON_SCALAR_ENCODERS[field.type]
+        else:
+            raise TypeError("Field {}.{} has unrecognised type id {}".format(
+                pbHandler.__class__.__name__, field.name, field.type))
+
+        if field.label == FD.LABEL_REPEATED:
+            def writer(value, parts, newline, indent):
+                if not value:
+                    parts.append("[]")
+                else:
+                    inner = newline + indent
+                    parts.append("[" + inner + ("," + inner).join(
+                            map(encoder, value)) + newline + "]")
+        else:
+            def writer(value, parts, newline, indent):
+                parts.append(encoder(value))
+
+    if field.is_extension:
+        return None, writer
+    return encode_basestring(field.name) + ": ", writer
 
-        if field.is_extension:
-            extensions[str(field.number)] = typeCallable(value)
-            continue
 
-        resultDict[field.name] = typeCallable(value)
+def _write_json_members(members, parts, newline, indent):
+    """
+    Write (key, writer, value) members as a json object, sorted by key.
+    Keys are unique, so writers are never compared.
+    """
+    if not members:
+        parts.append("{}")
+        return
+
+    members.sort()
+    inner = newline + indent
+    sep, close = "," + inner, newline + "}"
+    parts.append("{" + inner)
+    append = parts.append
+    first = True
+    for key, writer, value in members:
+        if first:
+            first = False
+        else:
+            append(sep)
+        append(key)
+        writer(value, parts, inner, indent)
+    append(close)
+
+
+def _write_json_message(
+        pbHandler, writers, parts, newline, indent, useEnumEabels):
+    """
+    Write pbHandler as a json object with compiled writers.
+    """
+    members = []
+    extensions = None
+    for field, value in pbHandler.ListFields():
+        entry = writers.get(field)
+        if entry is None:
+            entry = _compile_field_writer(pbHandler, field, useEnumEabels)
+            writers[field] = entry
+        key, writer = entry
+        if key is None:
+            if extensions is None:
+                extensions = []
+            extensions.append((encode_basestring(str(field.number)) + ": ",
+                    writer, value))
+        else:
+            members.append((key, writer, value))
 
     if extensions:
-        resultDict[_EXTENSION_CONTAINER] = extensions
+        members.append((encode_basestring(_EXTENSION_CONTAINER) + ": ",
+                _write_json_members, extensions))
+    _write_json_members(members, parts, newline, indent)
 
-    return resultDict
+    if len(parts) >= _JSON_FLUSH_PARTS:
+        parts.flush()
+
+
+def _write_json(pbHandler, parts, indent, useEnumEabels):
+    if not isinstance(indent, str):
+        indent = " " * indent
+    writers = _get_json_writers(pbHandler.DESCRIPTOR, useEnumEabels)
+    _write_json_message(pbHandler, writers, parts, "\n", indent, useEnumEabels)
+
+
+def _pbHandler_to_compact_json(pbHandler, useEnumEabels):
+    return json.dumps(
+            pbHandler_to_pyData(pbHandler, useEnumEabels = useEnumEabels),
+            sort_keys = True, ensure_ascii = False, separators = (",", ":"))
+
+
+def pbHandler_to_json(pbHandler, indent=None, useEnumEabels=False):
+    """
+    note   : Serialize pbHandler to json string.
+             The result equals json.dumps of pbHandler_to_pyData with
+             sort_keys = True and ensure_ascii = False, and with
+             separators = (",", ":") for compact json. Pretty json is
+             written directly without building pyData.
+    param  :
+        pbHandler       : Message.
+        indent          : None for compact json, or indent of pretty json.
+        useEnumEabels   : Write enum labels instead of numbers.
+    return : Json string.
+    """
+    if indent is None:
+        return _pbHandler_to_compact_json(pbHandler, useEnumEabels)
+
+    parts = _JsonParts()
+    _write_json(pbHandler, parts, indent, useEnumEabels)
+    return "".join(parts)
+
+
+def pbHandler_to_json_file(pbHandler, outputFile, indent=4, useEnumEabels=False,
+        appendFlag=False):
+    """
+    note   : Serialize pbHandler to json file, in the format of
+             pyData_to_json_file by default, or as pbHandler_to_json.
+    param  :
+        pbHandler       : Message.
+        outputFile      : File name, or file object to write to.
+        indent          : None for compact json, or indent of pretty json.
+        useEnumEabels   : Write enum labels instead of numbers.
+        appendFlag      : Append to file instead of overwriting it.
+    """
+    if hasattr(outputFile, "write"):
+        if indent is None:
+            outputFile.write(_pbHandler_to_compact_json(
+                    pbHandler, useEnumEabels))
+            outputFile.write("\n")
+            return
+
+        parts = _JsonParts(outputFile)
+        _write_json(pbHandler, parts, indent, useEnumEabels)
+        parts.append("\n")
+        parts.flush()
+        return
+
+    with open(outputFile, "a" if appendFlag else "w", encoding = "utf-8") as f:
+        pbHandler_to_json_file(pbHandler, f, indent, useEnumEabels)
 
 
 def pbFile_to_pbHandler(clsName, pbFile):
     """
     Convert pbFile to pbHandler.
+    The file is memory-mapped and parsed without copying it to a pbString.
     """
-    pbString = pbFile_to_pbString(pbFile)
-    return pbString_to_pbHandler(clsName, pbString)
+    if not is_file_existing(pbFile):
+        return None
+
+    with open(pbFile, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return pbString_to_pbHandler(clsName, b"")
+
+        with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as m:
+            with memoryview(m) as view:
+                return pbString_to_pbHandler(clsName, view)
 
 
 def pbString_to_pyData(clsName, pbString):
@@ -282,8 +1007,7 @@ def pbFile_to_pyData(clsName, pbFile):
     """
     Convert pbFile to pyData.
     """
-    pbString = pbFile_to_pbString(pbFile)
-    pbHandler = pbString_to_pbHandler(clsName, pbString)
+    pbHandler = pbFile_to_pbHandler(clsName, pbFile)
     if not pbHandler:
         return None
     return pbHandler_to_pyData(pbHandler)
@@ -297,9 +1021,13 @@ def pbDebugFile_to_pbHandler(clsName, pbDebugFile):
     if not is_file_existing(pbDebugFile):
         return result
 
-    with open(pbDebugFile, "r") as f:
-        pbHandler = eval(clsName + "()")
-        text_format.Parse(f.read().encode("utf-8"), pbHandler)
+    cls = get_pb_class(clsName)
+    if not cls:
+        return result
+
+    with open(pbDebugFile, "r", encoding = "utf-8") as f:
+        pbHandler = cls()
+        text_format.Parse(f.read(), pbHandler)
 
     return pbHandler
 
@@ -321,6 +1049,434 @@ def pbDebugFile_to_json_file(clsName, pbDebugFile, outputFile):
     """
     Convert pbDebugFile to json_file.
     """
-    pyData = pbDebugFile_to_pyData(clsName, pbDebugFile)
-    pyData_to_json_file(pyData, outputFile)
+    pbHandler = pbDebugFile_to_pbHandler(clsName, pbDebugFile)
+    if not pbHandler:
+        pyData_to_json_file(None, outputFile)
+        return
+    pbHandler_to_json_file(pbHandler, outputFile)
+
+
+# Debug files may hold many text messages, separated by blank lines or by
+# separator lines outside of any message.
+_PB_TEXT_OPENS = "{<"
+_PB_TEXT_CLOSES = "}>"
+_PB_TEXT_BUFFER_SIZE = 1 << 20
+
+
+def _get_pbText_depth(line, depth):
+    """
+    Return nesting depth after a text format line, skipping strings and
+    comments.
+    """
+    if "\"" not in line and "'" not in line and "#" not in line:
+        return depth + line.count("{") + line.count("<") \
+                - line.count("}") - line.count(">")
+
+    quote = None
+    escaped = False
+    for char in line:
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char == "\"" or char == "'":
+            quote = char
+        elif char == "#":
+            break
+        elif char in _PB_TEXT_OPENS:
+            depth += 1
+        elif char in _PB_TEXT_CLOSES:
+            depth -= 1
+    return depth
+
+
+def pbDebugFile_to_pbTexts(pbDebugFile, separator=None):
+    """
+    note   : Yield text of every message in pbDebugFile, reading it by lines.
+    param  :
+        pbDebugFile : File of concatenated text format messages.
+        separator   : Line between messages, blank lines by default. Only
+                      lines outside of "{}" or "<>" split messages.
+    """
+    if not is_file_existing(pbDebugFile):
+        return
+
+    lines = []
+    # Lines of comments only do not make a message.
+    hasFields = False
+    depth = 0
+    with open(pbDebugFile, "r", encoding = "utf-8",
+            buffering = _PB_TEXT_BUFFER_SIZE) as f:
+        for line in f:
+            stripped = line.strip()
+            if depth <= 0:
+                if (stripped == separator.strip() if separator is not None
+                        else not stripped):
+                    if hasFields:
+                        yield "".join(lines)
+                    lines = []
+                    hasFields = False
+                    continue
+            lines.append(line)
+            hasFields = hasFields or (stripped and stripped[0] != "#")
+            depth = _get_pbText_depth(line, depth)
+
+    if hasFields:
+        yield "".join(lines)
+
+
+def pbDebugFile_to_pbHandlers(clsName, pbDebugFile, separator=None):
+    """
+    Yield pbHandlers of every message in pbDebugFile, parsed lazily.
+    """
+    cls = get_pb_class(clsName)
+    if not cls:
+        return
+
+    for pbText in pbDebugFile_to_pbTexts(pbDebugFile, separator):
+        pbHandler = cls()
+        text_format.Parse(pbText, pbHandler)
+        yield pbHandler
+
+
+def pbDebugFile_to_jsonLines(clsName, pbDebugFile, outputFile, separator=None,
+        useEnumEabels=False):
+    """
+    note   : Convert every message in pbDebugFile to one line of outputFile.
+             Messages are parsed and written one by one.
+    param  :
+        clsName         : Message class name.
+        pbDebugFile     : File of concatenated text format messages.
+        outputFile      : Output json lines file.
+        separator       : Line between messages, blank lines by default.
+        useEnumEabels   : Write enum labels instead of numbers.
+    return : Count of messages written.
+    """
+    count = 0
+    with open(outputFile, "w", encoding = "utf-8",
+            buffering = _PB_TEXT_BUFFER_SIZE) as f:
+        for pbHandler in pbDebugFile_to_pbHandlers(
+                clsName, pbDebugFile, separator):
+            pbHandler_to_json_file(pbHandler, f, None, useEnumEabels)
+            count += 1
+    return count
+
+
+# Record stream of pbStrings:
+#   record  : varint(length of pbString) + pbString
+#   footer  : optional, offsets of records as uint64 + _RECORD_FOOTER
+_RECORD_BUFFER_SIZE = 1 << 20
+_RECORD_INDEX_MAGIC = b"PBRIDX01"
+# (offset of index, count of records, magic)
+_RECORD_FOOTER = struct.Struct("<QQ8s")
+_RECORD_OFFSET = struct.Struct("<Q")
+
+
+def _encode_varint(value):
+    """
+    Encode unsigned int as varint.
+    """
+    result = bytearray()
+    while value > 0x7f:
+        result.append((value & 0x7f) | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def _decode_varint(buf, pos):
+    """
+    Decode varint from buf at pos, return (value, next pos).
+    """
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(buf):
+            raise ValueError("Truncated varint in pb record stream.")
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 64:
+            raise ValueError("Invalid varint in pb record stream.")
+
+
+class PbRecordWriter():
+    """
+    Buffered writer of pb record stream files.
+    """
+    def __init__(self, fileName=None, withIndex=False,
+            bufferSize=_RECORD_BUFFER_SIZE):
+        """
+        Initialization.
+        If "fileName" was not specified, write to a temp file.
+        If "withIndex" was set, offsets of records are appended at closing.
+        """
+        if not fileName:
+            fileName = generate_temp_file()
+
+        self.fileName = str(fileName)
+        self.count = 0
+        self._file = open(self.fileName, "wb", buffering = bufferSize)
+        self._offset = 0
+        self._offsets = [] if withIndex else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, pbString):
+        """
+        Append a pbString, or a pbHandler, as a record.
+        """
+        if not isinstance(pbString, (bytes, bytearray, memoryview)):
+            pbString = pbHandler_to_pbString(pbString)
+
+        if self._offsets is not None:
+            self._offsets.append(self._offset)
+
+        head = _encode_varint(len(pbString))
+        self._file.write(head)
+        self._file.write(pbString)
+        self._offset += len(head) + len(pbString)
+        self.count += 1
+
+    def close(self):
+        """
+        Write index footer if required and close file.
+        """
+        if self._file.closed:
+            return
+
+        if self._offsets is not None:
+            for offset in self._offsets:
+                self._file.write(_RECORD_OFFSET.pack(offset))
+            self._file.write(_RECORD_FOOTER.pack(
+                    self._offset, self.count, _RECORD_INDEX_MAGIC))
+        self._file.close()
+
+
+def _read_record_footer(f):
+    """
+    Return (offset of index, count of records) of an opened record file,
+    None if the file has no index.
+    """
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    if size < _RECORD_FOOTER.size:
+        return None
+
+    f.seek(size - _RECORD_FOOTER.size)
+    indexOffset, count, magic = _RECORD_FOOTER.unpack(f.read(_RECORD_FOOTER.size))
+    if magic != _RECORD_INDEX_MAGIC or \
+            indexOffset + count * _RECORD_OFFSET.size + _RECORD_FOOTER.size != size:
+        return None
+
+    return indexOffset, count
+
+
+def read_pbRecordIndex(pbFile):
+    """
+    Return offsets of records in pbFile, None if pbFile has no index.
+    """
+    if not is_file_existing(pbFile):
+        return None
 
+    with open(pbFile, "rb") as f:
+        footer = _read_record_footer(f)
+        if footer is None:
+            return None
+        indexOffset, count = footer
+        f.seek(indexOffset)
+        data = f.read(count * _RECORD_OFFSET.size)
+
+    return [offset for (offset,) in _RECORD_OFFSET.iter_unpack(data)]
+
+
+def pbStrings_to_pbRecordFile(pbStrings, fileName=None, withIndex=False):
+    """
+    Write pbStrings, or pbHandlers, to a pb record file.
+    If "fileName" was not specified, write to a temp file.
+    """
+    with PbRecordWriter(fileName, withIndex) as writer:
+        for pbString in pbStrings:
+            writer.write(pbString)
+
+    return writer.fileName
+
+
+def pyDatas_to_pbRecordFile(clsName, pyDatas, fileName=None, withIndex=False,
+        strict=False):
+    """
+    Convert pyDatas to a pb record file.
+    """
+    return pbStrings_to_pbRecordFile(
+            (pyData_to_pbHandler(clsName, pyData, strict) for pyData in pyDatas),
+            fileName, withIndex)
+
+
+def pbRecordFile_to_pbStrings(pbFile, bufferSize=_RECORD_BUFFER_SIZE):
+    """
+    Yield pbStrings of a pb record file, reading it by chunks.
+    """
+    if not is_file_existing(pbFile):
+        return
+
+    with open(pbFile, "rb") as f:
+        footer = _read_record_footer(f)
+        if footer is None:
+            end = f.tell()
+        else:
+            end = footer[0]
+        f.seek(0)
+
+        buf = b""
+        pos = 0
+        # Offset of buf[0] in file.
+        base = 0
+        while base + pos < end:
+            if len(buf) - pos < 10:
+                buf = buf[pos:] + f.read(bufferSize)
+                base += pos
+                pos = 0
+            length, pos = _decode_varint(buf, pos)
+
+            if len(buf) - pos < length:
+                buf = buf[pos:] + f.read(max(bufferSize, length - len(buf) + pos))
+                base += pos
+                pos = 0
+                if len(buf) < length:
+                    raise ValueError("Truncated record in {}.".format(pbFile))
+
+            yield buf[pos:pos + length]
+            pos += length
+
+
+def pbRecordFile_to_pbHandlers(clsName, pbFile):
+    """
+    Yield pbHandlers of a pb record file.
+    """
+    for pbString in pbRecordFile_to_pbStrings(pbFile):
+        yield pbString_to_pbHandler(clsName, pbString)
+
+
+def pbRecordFile_to_pyDatas(clsName, pbFile):
+    """
+    Yield pyDatas of a pb record file.
+    """
+    for pbHandler in pbRecordFile_to_pbHandlers(clsName, pbFile):
+        if pbHandler is None:
+            yield None
+        else:
+            yield pbHandler_to_pyData(pbHandler)
+
+
+class PbRecordReader():
+    """
+    Random access reader of pb record files, backed by mmap.
+    Records are located by the index footer, or by one scan of the file if
+    it has no index. pbStrings are returned as memoryviews of the mapping,
+    which stays mapped after closing the reader until they are released.
+    """
+    def __init__(self, pbFile):
+        """
+        Initialization.
+        """
+        self._file = open(pbFile, "rb")
+        self._mmap = None
+        self._view = memoryview(b"")
+        self._offsets = None
+        self._indexOffset = None
+
+        size = os.fstat(self._file.fileno()).st_size
+        if size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                    access = mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+
+        footer = _read_record_footer(self._file)
+        if footer is not None:
+            self._indexOffset, self._count = footer
+            return
+
+        self._offsets = []
+        pos = 0
+        while pos < size:
+            self._offsets.append(pos)
+            length, pos = _decode_varint(self._view, pos)
+            pos += length
+        if pos != size:
+            raise ValueError("Truncated record in {}.".format(pbFile))
+        self._count = len(self._offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self.get_pbString(index)
+
+    def get_offset(self, index):
+        """
+        Return offset of record at index.
+        """
+        if index < 0:
+            index += self._count
+        if index < 0 or index >= self._count:
+            raise IndexError("Record index out of range.")
+
+        if self._offsets is not None:
+            return self._offsets[index]
+        return _RECORD_OFFSET.unpack_from(self._mmap,
+                self._indexOffset + index * _RECORD_OFFSET.size)[0]
+
+    def get_pbString(self, index):
+        """
+        Return pbString of record at index, as a memoryview.
+        """
+        length, pos = _decode_varint(self._view, self.get_offset(index))
+        return self._view[pos:pos + length]
+
+    def get_pbHandler(self, clsName, index):
+        """
+        Return pbHandler of record at index.
+        """
+        with self.get_pbString(index) as view:
+            return pbString_to_pbHandler(clsName, view)
+
+    def get_pyData(self, clsName, index):
+        """
+        Return pyData of record at index.
+        """
+        pbHandler = self.get_pbHandler(clsName, index)
+        if pbHandler is None:
+            return None
+        return pbHandler_to_pyData(pbHandler)
+
+    def close(self):
+        """
+        Unmap and close file.
+        The mapping is left to be unmapped by garbage collection while
+        pbStrings of it are still referenced.
+        """
+        self._view.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+        self._file.close()
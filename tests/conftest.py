@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+_COMMON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        os.pardir, "common")
+
+# Modules of common import their siblings by plain name.
+sys.path.insert(0, _COMMON_DIR)
+
+
+@pytest.fixture(scope = "session")
+def pb_benchmark_pb2(tmp_path_factory):
+    """
+    Message classes of pb_benchmark.proto, compiled by protoc or grpc_tools.
+    """
+    pb_benchmark = pytest.importorskip("pb_benchmark")
+    schemaDir = str(tmp_path_factory.mktemp("schema"))
+    try:
+        pb_benchmark.compile_proto(pb_benchmark._PROTO_FILE, schemaDir)
+    except RuntimeError as e:
+        pytest.skip(str(e))
+    return pb_benchmark._load_schema(schemaDir)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextlib
+import socket
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+
+from async_http_client import AsyncHttpClient
+
+
+@contextlib.asynccontextmanager
+async def _serve(handler):
+    """
+    Serve handler on POST /echo of a local port, yield the url.
+    """
+    app = web.Application()
+    app.router.add_post("/echo", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    try:
+        host, port = runner.addresses[0][:2]
+        yield "http://{}:{}/echo".format(host, port)
+    finally:
+        await runner.cleanup()
+
+
+def _unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_concurrency_limits_requests_in_flight():
+    active = [0, 0]
+
+    async def handler(request):
+        active[0] += 1
+        active[1] = max(active[1], active[0])
+        await asyncio.sleep(0.05)
+        active[0] -= 1
+        return web.Response(body = await request.read())
+
+    async def run():
+        async with _serve(handler) as url:
+            async with AsyncHttpClient(url = url, concurrency = 3) as client:
+                return [r async for r in client.iter_requests(count = 12,
+                        datas = [str(i) for i in range(12)])]
+
+    results = asyncio.run(run())
+    assert len(results) == 12
+    assert active[1] == 3
+
+
+def test_results_carry_index_of_their_data():
+    async def handler(request):
+        body = await request.read()
+        # Later requests finish first.
+        await asyncio.sleep(0.01 * (10 - int(body)))
+        return web.Response(body = body)
+
+    async def run():
+        async with _serve(handler) as url:
+            async with AsyncHttpClient(url = url, concurrency = 10) as client:
+                return [r async for r in client.iter_requests(
+                        [str(i) for i in range(10)])]
+
+    results = asyncio.run(run())
+    assert [r["index"] for r in results] != list(range(10))
+    assert sorted(r["index"] for r in results) == list(range(10))
+    for result in results:
+        assert result["body"] == str(result["index"]).encode()
+        assert result["status"] == 200
+        assert result["error"] is None
+        assert result["latency"] == result["elapsed"]
+
+
+def test_errors_are_kept_in_results():
+    async def handler(request):
+        return web.Response(status = 500, body = b"failed")
+
+    async def run():
+        async with _serve(handler) as url:
+            async with AsyncHttpClient(url = url, data = b"x") as client:
+                failed = [r async for r in client.iter_requests(count = 2)]
+        client = AsyncHttpClient(
+                url = "http://127.0.0.1:{}/echo".format(_unused_port()),
+                data = b"x", concurrency = 2)
+        async with client:
+            refused = [r async for r in client.iter_requests(count = 3)]
+        return failed, refused
+
+    failed, refused = asyncio.run(run())
+    assert [(r["status"], r["body"], r["error"]) for r in failed] == \
+            [(500, b"failed", None)] * 2
+    assert len(refused) == 3
+    for result in refused:
+        assert result["status"] is None
+        assert result["error"].startswith("ClientConnectorError")
+
+
+def test_errors_of_datas_are_raised():
+    async def handler(request):
+        return web.Response(body = await request.read())
+
+    def datas():
+        yield b"a"
+        raise RuntimeError("broken datas")
+
+    async def run():
+        async with _serve(handler) as url:
+            async with AsyncHttpClient(url = url, concurrency = 2) as client:
+                return [r async for r in client.iter_requests(datas())]
+
+    with pytest.raises(RuntimeError, match = "broken datas"):
+        asyncio.run(run())
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+import json
+import random
+
+import pytest
+
+import diff
+
+
+_NUMBERS = '[1.5, 12e3, -0.25E-2, 100, 7E+1, {"a": 3.25, "b": [-4.125]}, 0]'
+
+
+@pytest.mark.parametrize("chunkSize", range(1, len(_NUMBERS) + 1))
+def test_json_item_reader_numbers_across_chunks(tmp_path, chunkSize):
+    jsonFile = tmp_path / "numbers.json"
+    jsonFile.write_text(_NUMBERS)
+
+    with diff._JsonItemReader(str(jsonFile), chunkSize) as reader:
+        items = [value for _, value in reader]
+
+    assert items == json.loads(_NUMBERS)
+
+
+def test_json_item_reader_dict_members_across_chunks(tmp_path):
+    text = '{"x": 1.75, "y": 2e-3, "z": "s"}'
+    jsonFile = tmp_path / "members.json"
+    jsonFile.write_text(text)
+
+    for chunkSize in range(1, len(text) + 1):
+        with diff._JsonItemReader(str(jsonFile), chunkSize) as reader:
+            assert dict(reader) == json.loads(text)
+
+
+@pytest.mark.parametrize("path", ["$.ts", "$[0].ts", "$.a.ts", "$.a[2].b.ts"])
+def test_double_star_glob_matches_any_depth(path):
+    assert diff.CompareRules(ignorePaths = ["$.**.ts"]).is_ignored(path)
+
+
+@pytest.mark.parametrize("path", ["$.ts2", "$.a.xts", "$[0]"])
+def test_double_star_glob_keeps_key_boundary(path):
+    assert not diff.CompareRules(ignorePaths = ["$.**.ts"]).is_ignored(path)
+
+
+def test_tolerance_is_not_a_grid():
+    rules = diff.CompareRules(floatTolerance = 0.1)
+    # Neighbouring buckets of the tolerance grid.
+    assert diff.compare_data({"v": 0.149}, {"v": 0.151}, "unused", rules)
+    assert diff.get_data_diff([[0.149], 1], [1, [0.151]], rules) == []
+    assert diff.get_data_diff({"v": 0.1}, {"v": 0.25}, rules) == \
+            [("$.v", "changed", 0.1, 0.25)]
+
+
+def test_fingerprint_keeps_tolerance_order():
+    first = diff.CompareRules(tolerances = {"$.a": 0.1, "$.*": 1.0})
+    second = diff.CompareRules(tolerances = {"$.*": 1.0, "$.a": 0.1})
+    assert first.get_tolerance("$.a") != second.get_tolerance("$.a")
+    assert first.fingerprint != second.fingerprint
+
+
+@pytest.mark.parametrize("rules", [None, diff.CompareRules(floatTolerance = 0.1)])
+def test_diff_digests_each_node_once(monkeypatch, rules):
+    depth = 200
+    chainA, chainB = {"v": 0.5}, {"v": 1}
+    for i in range(depth):
+        chainA, chainB = {"k": chainA, "n": [i]}, {"k": chainB, "n": [i]}
+    canonicalizer = diff._get_canonicalizer(rules)
+    calls = []
+    hashBytes = diff._hash_bytes
+    monkeypatch.setattr(diff, "_hash_bytes",
+            lambda *args: calls.append(1) or hashBytes(*args))
+    assert list(canonicalizer.iter_diff(chainA, chainB)) == \
+            [("$" + ".k" * depth + ".v", "changed", 0.5, 1)]
+    assert len(calls) < 20 * depth
+
+
+@pytest.mark.parametrize("dataA, dataB", [
+    ([1, "1"], ["1", 1]),
+    ([{"a": 1}, {}], [{}, {"a": 1}]),
+    ({"k": [1, "1"]}, {"k": ["1", 1]}),
+    ([1, 1.0], [1.0, 1]),
+    ([1, "1", 2], [2, 1, "1"]),
+])
+def test_stream_gives_same_answer(tmp_path, dataA, dataB):
+    fileA, fileB = tmp_path / "a.json", tmp_path / "b.json"
+    fileA.write_text(json.dumps(dataA))
+    fileB.write_text(json.dumps(dataB))
+    prefix = str(tmp_path / "diff")
+    expected = diff.compare_data(dataA, dataB, prefix)
+    assert diff.compare_data_json(str(fileA), str(fileB), True, prefix) == \
+            expected
+    assert diff.compare_data_json_streaming(str(fileA), str(fileB), prefix,
+            memoryLimit = 1) == expected
+
+
+def _random_data(rnd, depth=0):
+    if depth > 2 or rnd.random() < 0.4:
+        return rnd.choice([0, 1, "1", "a", 1.0, 1.5, True, None])
+    if rnd.random() < 0.6:
+        return [_random_data(rnd, depth + 1) for _ in range(rnd.randint(0, 4))]
+    return {rnd.choice("abc"): _random_data(rnd, depth + 1)
+            for _ in range(rnd.randint(0, 3))}
+
+
+def _shuffled(rnd, inputData):
+    if isinstance(inputData, list):
+        inputData = [_shuffled(rnd, e) for e in inputData]
+        rnd.shuffle(inputData)
+    elif isinstance(inputData, dict):
+        inputData = {k: _shuffled(rnd, v) for k, v in inputData.items()}
+    return inputData
+
+
+def _data_pairs(count):
+    rnd = random.Random(5)
+    pairs = [([1, "1"], ["1", 1]), ({"k": [1, 1.0]}, {"k": [1.0, 1]})]
+    while len(pairs) < count:
+        dataA = _random_data(rnd)
+        pairs.append((dataA, _shuffled(rnd, dataA)))
+    return pairs
+
+
+def test_batch_agrees_with_single_compare(tmp_path):
+    filePairs = []
+    expected = []
+    for i, (dataA, dataB) in enumerate(_data_pairs(300)):
+        fileA, fileB = tmp_path / "{}_a.json".format(i), \
+                tmp_path / "{}_b.json".format(i)
+        fileA.write_text(json.dumps(dataA))
+        fileB.write_text(json.dumps(dataB))
+        filePairs.append((str(fileA), str(fileB)))
+        expected.append(diff.compare_data(dataA, dataB, str(tmp_path / "d")))
+
+    results = diff.compare_data_json_batch(filePairs, workers = 1,
+            diffDir = str(tmp_path))
+    assert [r["equal"] for r in results] == expected
+    assert [diff.compare_data_json(a, b, diffFilePrefix = str(tmp_path / "d"))
+            for a, b in filePairs] == expected
+    assert not all(expected) and any(expected)
+
+
+def test_batch_reports_undecodable_files(tmp_path):
+    corrupt = tmp_path / "corrupt.json"
+    corrupt.write_text("{")
+    empty = tmp_path / "empty.json"
+    empty.write_text("{}")
+
+    results = diff.compare_data_json_batch(
+            [(str(corrupt), str(corrupt)), (str(empty), str(corrupt))],
+            workers = 1, diffDir = str(tmp_path))
+    for result in results:
+        assert result["equal"] is False
+        assert str(corrupt) in result["error"]
+
+
+@pytest.mark.parametrize("storeCanonical", [False, True])
+@pytest.mark.parametrize("rules", [None, diff.CompareRules(floatTolerance = 0.1)])
+def test_cache_does_not_change_results(tmp_path, storeCanonical, rules):
+    pairs = _data_pairs(100) + [({"v": 0.149}, {"v": 0.151}),
+            ({"v": 0.1}, {"v": 0.25})]
+    cache = diff.CanonicalCache(str(tmp_path / "cache"),
+            storeCanonical = storeCanonical)
+    prefix = str(tmp_path / "d")
+    for i, (dataA, dataB) in enumerate(pairs):
+        fileA, fileB = tmp_path / "{}_a.json".format(i), \
+                tmp_path / "{}_b.json".format(i)
+        fileA.write_text(json.dumps(dataA))
+        fileB.write_text(json.dumps(dataB))
+        expected = diff.compare_data(dataA, dataB, prefix, rules)
+        # Once filling the cache, once reading it.
+        for _ in range(2):
+            assert diff.compare_data_json(str(fileA), str(fileB),
+                    diffFilePrefix = prefix, rules = rules,
+                    cache = cache) == expected
+        results = diff.compare_data_json_batch([(str(fileA), str(fileB))],
+                diffDir = str(tmp_path), rules = rules, cache = cache)
+        assert results[0]["equal"] == expected
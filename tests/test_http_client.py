@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import hashlib
+import os
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+import http_client
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """
+    Serve server.content, with ranges if server.acceptRanges. The next
+    server.failures responses are cut in half.
+    """
+    def do_HEAD(self):
+        self._send(head = True)
+
+    def do_GET(self):
+        self._send()
+
+    def _send(self, head=False):
+        server = self.server
+        content = server.content
+        rangeHeader = self.headers.get("Range")
+        start, end = 0, len(content)
+        status = 200
+        if not head:
+            server.ranges.append(rangeHeader)
+        if rangeHeader and server.acceptRanges:
+            first, last = rangeHeader[len("bytes="):].split("-")
+            start = int(first)
+            end = int(last) + 1 if last else len(content)
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        body = content[start:end]
+        self.send_response(status)
+        if server.acceptRanges:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(
+                    start, end - 1, len(content)))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if head:
+            return
+
+        with server.lock:
+            fail = server.failures > 0
+            server.failures -= fail
+        if fail:
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _CachedHandler(BaseHTTPRequestHandler):
+    """
+    Serve server.content with server.headers, answer 304 to a matching
+    If-None-Match or If-Modified-Since.
+    """
+    def do_GET(self):
+        server = self.server
+        server.conditions.append((self.headers.get("If-None-Match"),
+                self.headers.get("If-Modified-Since")))
+        etag = server.headers.get("ETag")
+        lastModified = server.headers.get("Last-Modified")
+        if (etag and self.headers.get("If-None-Match") == etag) or (
+                lastModified and
+                self.headers.get("If-Modified-Since") == lastModified):
+            self.send_response(304)
+            for name, value in server.headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        for name, value in server.headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(server.content)))
+        self.end_headers()
+        self.wfile.write(server.content)
+
+    def log_message(self, *args):
+        pass
+
+
+class _PathHandler(BaseHTTPRequestHandler):
+    """
+    Answer GET with the requested path.
+    """
+    def do_GET(self):
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def _serve(handler):
+    """
+    Serve handler on a local port, yield the server.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target = server.serve_forever, args = (0.05,),
+            daemon = True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def fileServer():
+    with _serve(_FileHandler) as server:
+        server.content = random.Random(1).randbytes(300000)
+        server.acceptRanges = True
+        server.failures = 0
+        server.ranges = []
+        server.lock = threading.Lock()
+        server.url = "http://127.0.0.1:{}/file".format(server.server_port)
+        yield server
+
+
+@pytest.fixture
+def cachedServer():
+    with _serve(_CachedHandler) as server:
+        server.content = b"v1"
+        server.headers = {}
+        server.conditions = []
+        server.url = "http://127.0.0.1:{}/data".format(server.server_port)
+        yield server
+
+
+def _read(fileName):
+    with open(fileName, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("segments", [1, 4])
+def test_download_checks_checksum(tmp_path, fileServer, segments):
+    saveAs = str(tmp_path / "file")
+    checksum = hashlib.sha256(fileServer.content).hexdigest()
+    assert http_client.download_file_by_url(fileServer.url, saveAs,
+            chunkSize = 4096, segments = segments, checksum = checksum.upper())
+    assert _read(saveAs) == fileServer.content
+
+    os.remove(saveAs)
+    assert not http_client.download_file_by_url(fileServer.url, saveAs,
+            chunkSize = 4096, segments = segments, checksum = "0" * 64)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_download_resumes_from_part_file(tmp_path, fileServer):
+    saveAs = str(tmp_path / "file")
+    checksum = hashlib.sha256(fileServer.content).hexdigest()
+    fileServer.failures = 1
+    assert not http_client.download_file_by_url(fileServer.url, saveAs,
+            chunkSize = 4096, checksum = checksum)
+    offset = os.path.getsize(saveAs + ".part")
+    assert 0 < offset < len(fileServer.content)
+
+    assert http_client.download_file_by_url(fileServer.url, saveAs,
+            chunkSize = 4096, resume = True, checksum = checksum)
+    assert _read(saveAs) == fileServer.content
+    assert fileServer.ranges == [None, "bytes={}-".format(offset)]
+
+
+def test_download_restarts_if_range_is_ignored(tmp_path, fileServer):
+    saveAs = str(tmp_path / "file")
+    fileServer.acceptRanges = False
+    with open(saveAs + ".part", "wb") as f:
+        f.write(b"stale")
+
+    assert http_client.download_file_by_url(fileServer.url, saveAs,
+            chunkSize = 4096, resume = True, segments = 4,
+            checksum = hashlib.sha256(fileServer.content).hexdigest())
+    assert _read(saveAs) == fileServer.content
+    assert fileServer.ranges == ["bytes=5-"]
+
+
+def test_download_resumes_segments(tmp_path, fileServer):
+    saveAs = str(tmp_path / "file")
+    checksum = hashlib.sha256(fileServer.content).hexdigest()
+    fileServer.failures = 1
+    assert not http_client.download_file_by_url(fileServer.url, saveAs,
+            chunkSize = 4096, segments = 4, checksum = checksum)
+    assert os.path.exists(saveAs + ".part.json")
+    assert len(fileServer.ranges) == 4
+
+    fileServer.ranges = []
+    assert http_client.download_file_by_url(fileServer.url, saveAs,
+            chunkSize = 4096, resume = True, segments = 4, checksum = checksum)
+    assert _read(saveAs) == fileServer.content
+    assert os.listdir(str(tmp_path)) == ["file"]
+    # Only the rest of the cut segment is requested again.
+    assert len(fileServer.ranges) == 1
+    first, last = fileServer.ranges[0][len("bytes="):].split("-")
+    assert int(first) % 75000 > 0 and int(last) % 75000 == 74999
+
+
+def test_cache_revalidates_stale_entry_by_etag(cachedServer):
+    cachedServer.headers = {"Cache-Control": "no-cache", "ETag": '"1"'}
+    cache = http_client.HttpResponseCache()
+    session = requests.Session()
+    assert cache.fetch(session, cachedServer.url).content == b"v1"
+
+    resp = cache.fetch(session, cachedServer.url)
+    assert (resp.status_code, resp.content) == (200, b"v1")
+    assert cachedServer.conditions == [(None, None), ('"1"', None)]
+
+    cachedServer.content = b"v2"
+    cachedServer.headers["ETag"] = '"2"'
+    assert cache.fetch(session, cachedServer.url).content == b"v2"
+    assert cache.fetch(session, cachedServer.url).content == b"v2"
+    assert cachedServer.conditions[2:] == [('"1"', None), ('"2"', None)]
+    stats = cache.stats
+    assert (stats["hits"], stats["misses"], stats["revalidations"]) == \
+            (0, 2, 2)
+
+
+def test_cache_revalidates_by_last_modified(cachedServer):
+    lastModified = "Wed, 21 Oct 2015 07:28:00 GMT"
+    cachedServer.headers = {"Cache-Control": "max-age=0",
+            "Last-Modified": lastModified}
+    cache = http_client.HttpResponseCache()
+    session = requests.Session()
+    cache.fetch(session, cachedServer.url)
+    assert cache.fetch(session, cachedServer.url).content == b"v1"
+    assert cachedServer.conditions == [(None, None), (None, lastModified)]
+    assert cache.stats["revalidations"] == 1
+
+
+def test_cache_keeps_fresh_entries_on_disk(tmp_path, cachedServer):
+    cachedServer.headers = {"Cache-Control": "max-age=60"}
+    cachedServer.content = bytes(range(256))
+    session = requests.Session()
+    cache = http_client.HttpResponseCache(cacheDir = str(tmp_path))
+    cache.fetch(session, cachedServer.url)
+    assert cache.fetch(session, cachedServer.url).content == \
+            cachedServer.content
+    assert cache.stats["hits"] == 1
+
+    # A new cache finds the entry on disk.
+    cache = http_client.HttpResponseCache(cacheDir = str(tmp_path))
+    assert cache.fetch(session, cachedServer.url).content == \
+            cachedServer.content
+    assert cache.stats["hits"] == 1
+    assert len(cachedServer.conditions) == 1
+
+
+def test_cache_skips_no_store(cachedServer):
+    cachedServer.headers = {"Cache-Control": "no-store", "ETag": '"1"'}
+    cache = http_client.HttpResponseCache()
+    session = requests.Session()
+    cache.fetch(session, cachedServer.url)
+    cache.fetch(session, cachedServer.url)
+    assert cachedServer.conditions == [(None, None), (None, None)]
+    assert cache.stats["entries"] == 0
+
+
+@pytest.mark.parametrize("byUrl", [True, False])
+def test_launch_requests_applies_specs(byUrl):
+    with _serve(_PathHandler) as server, _serve(_PathHandler) as other:
+        port = server.server_port
+        if byUrl:
+            client = http_client.HttpClient(doPost = False,
+                    url = "http://127.0.0.1:{}/base?x=1".format(port))
+            base = "/base?x=1"
+        else:
+            client = http_client.HttpClient(doPost = False,
+                    host = "127.0.0.1", port = port, path = "base")
+            base = "/base"
+        results = client.launch_requests([
+                {},
+                {"path": "/a?y=2"},
+                {"path": "b"},
+                {"port": other.server_port},
+                {"host": "localhost", "path": "c"},
+                {"url": "http://127.0.0.1:{}/d".format(other.server_port)},
+                ], workers = 3)
+
+    assert [r["error"] for r in results] == [None] * 6
+    assert [r["body"] for r in results] == [base.encode(), b"/a?y=2", b"/b",
+            base.encode(), b"/c", b"/d"]
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+
+import load_generator
+
+
+@pytest.fixture
+def slowServer():
+    """
+    Local server answering GET /slow at teardown, and GET /fast at once,
+    served from a thread as run_load runs its own event loop.
+    """
+    release = asyncio.Event()
+
+    async def slow(request):
+        await release.wait()
+        return web.Response(body = b"slow")
+
+    async def fast(request):
+        return web.Response(body = b"fast")
+
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_get("/slow", slow)
+    app.router.add_get("/fast", fast)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    host, port = runner.addresses[0][:2]
+    thread = threading.Thread(target = loop.run_forever, daemon = True)
+    thread.start()
+    yield "http://{}:{}".format(host, port)
+    loop.call_soon_threadsafe(release.set)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.run_until_complete(runner.cleanup())
+    loop.close()
+
+
+def test_percentiles_of_small_latencies_are_exact():
+    histogram = load_generator.LatencyHistogram()
+    for micros in range(1, 101):
+        histogram.record(micros / 1e6)
+    assert histogram.count == 100
+    assert histogram.percentile(50) == pytest.approx(50e-6)
+    assert histogram.percentile(99) == pytest.approx(99e-6)
+    assert histogram.percentile(100) == pytest.approx(100e-6)
+    assert histogram.mean() == pytest.approx(50.5e-6)
+
+
+def test_percentiles_keep_relative_error():
+    histogram = load_generator.LatencyHistogram(subBucketBits = 7)
+    values = [0.001 * 1.01 ** i for i in range(1000)]
+    for value in values:
+        histogram.record(value)
+    for percent in (1, 50, 90, 99, 99.9):
+        expected = values[int(-(-len(values) * percent // 100)) - 1]
+        assert histogram.percentile(percent) >= expected
+        assert histogram.percentile(percent) <= expected * (1 + 2 ** -6)
+    assert histogram.percentile(100) == values[-1]
+    assert load_generator.LatencyHistogram().percentile(50) is None
+
+
+def test_merged_histogram_counts_both():
+    first, second = load_generator.LatencyHistogram(), \
+            load_generator.LatencyHistogram()
+    for i in range(10):
+        first.record(0.001)
+        second.record(0.1)
+    first.merge(second)
+    assert (first.count, first.min, first.max) == (20, 0.001, 0.1)
+    assert first.percentile(50) == pytest.approx(0.001, rel = 1e-3)
+    assert first.percentile(51) == pytest.approx(0.1, rel = 1e-3)
+
+
+def test_requests_in_flight_at_deadline_are_timeouts(slowServer):
+    start = time.perf_counter()
+    report = load_generator.run_load(
+            [{"url": slowServer + "/slow", "doPost": False}],
+            duration = 0.5, concurrency = 3)
+    assert time.perf_counter() - start < 5
+    assert report["requests"] == report["errors"] == 3
+    assert report["errorTypes"] == {"TimeoutError": 3}
+    assert report["latency"]["min"] >= 0.4
+
+
+def test_rate_stops_scheduling_at_deadline(slowServer):
+    report = load_generator.run_load(
+            [{"url": slowServer + "/fast", "doPost": False}],
+            duration = 0.5, rate = 20, concurrency = 2)
+    assert report["errors"] == 0
+    assert 9 <= report["requests"] <= 10
+    assert report["rate"]["target"] == 20
+    assert report["serviceTime"]["count"] == report["requests"]
+
+
+def test_main_fails_on_timeouts(tmp_path, slowServer):
+    confs = []
+    for name in ("fast", "slow"):
+        confFile = tmp_path / "{}.json".format(name)
+        confFile.write_text(json.dumps({"url": slowServer + "/" + name,
+                "doPost": False}))
+        confs.append(str(confFile))
+
+    output = tmp_path / "report.json"
+    assert load_generator.main(confs + ["--duration", "0.3",
+            "--concurrency", "2", "--output", str(output)]) == 1
+    report = json.loads(output.read_text())
+    assert list(report["errorTypes"]) == ["TimeoutError"]
+    # A fast request may also be in flight at deadline.
+    fast, slow = report["targets"]
+    assert fast["requests"] > fast["errors"]
+    assert slow["requests"] == slow["errors"] == 1
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+pytest.importorskip("google.protobuf")
+
+import py_pb_convert
+
+
+def test_converters_are_shared_by_equal_maps(pb_benchmark_pb2):
+    pbHandler = pb_benchmark_pb2.Flat(i32 = 3, s = "x")
+    for _ in range(3):
+        typeCallableMap = dict(py_pb_convert._TYPE_CALLABLE_MAP)
+        assert py_pb_convert.pbHandler_to_pyData(
+                pbHandler, typeCallableMap) == {"i32": 3, "s": "x"}
+
+    keys = [key for key in py_pb_convert._PYDATA_CONVERTERS
+            if key[0] is pbHandler.DESCRIPTOR]
+    assert len(keys) == 1
+
+
+def test_converters_cache_is_bounded(pb_benchmark_pb2, monkeypatch):
+    monkeypatch.setattr(py_pb_convert, "_PYDATA_CONVERTERS_LIMIT", 4)
+    pbHandler = pb_benchmark_pb2.Flat(i32 = 3)
+    for i in range(10):
+        typeCallableMap = dict(py_pb_convert._TYPE_CALLABLE_MAP)
+        typeCallableMap[py_pb_convert.FD.TYPE_INT32] = lambda v, i=i: v + i
+        assert py_pb_convert.pbHandler_to_pyData(
+                pbHandler, typeCallableMap) == {"i32": 3 + i}
+
+    assert len(py_pb_convert._PYDATA_CONVERTERS) <= 4
+
+
+@pytest.mark.parametrize("withIndex", [False, True])
+def test_record_reader_closes_with_records_referenced(tmp_path, withIndex):
+    pbStrings = [b"abc", b"", b"de"]
+    pbFile = py_pb_convert.pbStrings_to_pbRecordFile(
+            pbStrings, str(tmp_path / "records"), withIndex)
+
+    with py_pb_convert.PbRecordReader(pbFile) as reader:
+        for pbString in reader:
+            pass
+    assert bytes(pbString) == b"de"
+
+    with py_pb_convert.PbRecordReader(pbFile) as reader:
+        records = list(reader)
+    assert [bytes(r) for r in records] == pbStrings
+
+
+def test_registry_imports_submodule_of_from_import(tmp_path, monkeypatch):
+    package = tmp_path / "registry_pkg"
+    package.mkdir()
+    (package / "__init__.py").write_text("")
+    (package / "messages.py").write_text("class Message(object):\n    pass\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    registry = py_pb_convert.PbClassRegistry(
+            "from registry_pkg import messages")
+    cls = registry.get("messages.Message")
+    assert cls is not None and cls.__name__ == "Message"
+
+
+@pytest.mark.parametrize("indent", [None, 2, 4])
+def test_pbHandler_to_json_equals_json_dumps(pb_benchmark_pb2, indent):
+    pbHandler = pb_benchmark_pb2.RepeatedMessage(items = [
+            pb_benchmark_pb2.Flat(i32 = -1, d = 0.5, s = "中文", b = True),
+            pb_benchmark_pb2.Flat()])
+    pyData = py_pb_convert.pbHandler_to_pyData(pbHandler)
+    separators = (",", ":") if indent is None else None
+
+    assert py_pb_convert.pbHandler_to_json(pbHandler, indent) == json.dumps(
+            pyData, sort_keys = True, ensure_ascii = False, indent = indent,
+            separators = separators)